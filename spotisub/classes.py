@@ -1,9 +1,13 @@
 """Spotisub classes"""
 
+import sys
+import threading
 from typing import NamedTuple
 from spotisub import configuration_db, login
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from spotisub import constants
+from spotisub import utils
 
 
 class ComparisonHelper:
@@ -15,6 +19,27 @@ class ComparisonHelper:
         self.excluded = excluded
         self.song_ids = song_ids
         self.track_helper = track_helper
+        # a failed lookup makes a miss worth retrying on the next run
+        self.lookup_failed = False
+        # normalized on first comparison, tracks matched by id never need them
+        self._title_variants = None
+        self._artist_variants = None
+
+    @property
+    def title_variants(self):
+        """compare variants of the spotify track name"""
+        if self._title_variants is None:
+            self._title_variants = utils.generate_compare_array(
+                self.track["name"])
+        return self._title_variants
+
+    @property
+    def artist_variants(self):
+        """compare variants of the spotify artist name"""
+        if self._artist_variants is None:
+            self._artist_variants = utils.generate_compare_array(
+                self.artist_spotify["name"])
+        return self._artist_variants
 
 
 @login.user_loader
@@ -42,6 +67,88 @@ class User(configuration_db.Model, UserMixin):
         return check_password_hash(self.password_hash, password)
 
 
+class MatchMemo:
+    """library matches of spotify tracks, shared by the playlists of one import run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.matches = {}
+        self.hits = 0
+
+    def get(self, key):
+        """(True, match) if the track was already resolved, else (False, None)"""
+        with self.lock:
+            if key in self.matches:
+                self.hits = self.hits + 1
+                return True, self.matches[key]
+        return False, None
+
+    def put(self, key, match):
+        """remember the resolved match of a track"""
+        with self.lock:
+            self.matches[key] = match
+
+
+class SubsonicSong:
+    """compact library song, read like the libsonic song dict it comes from"""
+    __slots__ = constants.SUBSONIC_SONG_FIELDS + ("title_variants", "artist_variants")
+
+    def __init__(self, *values, title_variants=(), artist_variants=()):
+        for field, value in zip(constants.SUBSONIC_SONG_FIELDS, values):
+            setattr(self, field, value)
+        # normalized compare variants, precomputed by the library index
+        self.title_variants = title_variants
+        self.artist_variants = artist_variants
+
+    @classmethod
+    def from_dict(cls, song):
+        """compact a libsonic song dict"""
+        values = []
+        for field in constants.SUBSONIC_SONG_FIELDS:
+            value = song.get(field)
+            # artists and albums repeat across songs, share one string each
+            if isinstance(value, str) and field in constants.SUBSONIC_INTERNED_FIELDS:
+                value = sys.intern(value)
+            values.append(value)
+        return cls(*values)
+
+    def __getitem__(self, field):
+        value = self.get(field)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field) is not None
+
+    def get(self, field, default=None):
+        """value of a song field, default when missing"""
+        if field not in constants.SUBSONIC_SONG_FIELDS:
+            return default
+        value = getattr(self, field)
+        return default if value is None else value
+
+    def __repr__(self):
+        return f'SubsonicSong: {self.get("artist")} - {self.get("title")} ({self.get("id")})'
+
+
+class PlaylistListing(NamedTuple):
+    """user playlists in spotify order, indexed by normalized name and uri"""
+    items: list
+    by_name: dict
+    by_uri: dict
+
+
+class LibraryFingerprint(NamedTuple):
+    song_count: int | None
+    folder_count: int | None
+    last_scan: str | None
+    folders_modified: tuple[tuple[str, int], ...]
+
+
 class SubsonicCache(NamedTuple):
     total_song_count: int
-    song_mbid_dict: dict[str, object]
+    # spotisub.library_index.LibraryIndex, None for an empty library
+    index: object | None = None
+    newest_album_created: str | None = None
+    library_fingerprint: LibraryFingerprint | None = None
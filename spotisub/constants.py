@@ -18,10 +18,13 @@ LIDARR_PORT = "LIDARR_PORT"
 LIDARR_TOKEN = "LIDARR_TOKEN"
 LIDARR_USE_SSL = "LIDARR_USE_SSL"
 LOG_LEVEL = "LOG_LEVEL"
+MUSICBRAINZ_CACHE_HOURS = "MUSICBRAINZ_CACHE_HOURS"
+MUSICBRAINZ_NOT_FOUND_CACHE_HOURS = "MUSICBRAINZ_NOT_FOUND_CACHE_HOURS"
 NUM_USER_PLAYLISTS = "NUM_USER_PLAYLISTS"
 PLAYLIST_GEN_SCHED = "PLAYLIST_GEN_SCHED"
 PLAYLIST_PREFIX = "PLAYLIST_PREFIX"
 RECOMMEND_GEN_SCHED = "RECOMMEND_GEN_SCHED"
+REIMPORT_WORKERS = "REIMPORT_WORKERS"
 SAVED_GEN_SCHED = "SAVED_GEN_SCHED"
 SCHEDULER_ENABLED = "SCHEDULER_ENABLED"
 SPOTDL_ENABLED = "SPOTDL_ENABLED"
@@ -34,6 +37,8 @@ SUBSONIC_API_HOST = "SUBSONIC_API_HOST"
 SUBSONIC_API_USER = "SUBSONIC_API_USER"
 SUBSONIC_API_PASS = "SUBSONIC_API_PASS"
 SUBSONIC_API_PORT = "SUBSONIC_API_PORT"
+SUBSONIC_CACHE_CHECK_SECONDS = "SUBSONIC_CACHE_CHECK_SECONDS"
+SUBSONIC_CACHE_WORKERS = "SUBSONIC_CACHE_WORKERS"
 TEXT_COMAPRE_MATCHING_ENABLED = "TEXT_COMAPRE_MATCHING_ENABLED"
 
 # Default configuration values constants
@@ -46,10 +51,13 @@ LIDARR_BASE_API_PATH_DEFAULT_VALUE = ""
 LIDARR_ENABLED_DEFAULT_VALUE = "0"
 LIDARR_USE_SSL_DEFAULT_VALUE = "0"
 LOG_LEVEL_DEFAULT_VALUE = "40"
+MUSICBRAINZ_CACHE_HOURS_DEFAULT_VALUE = "720"
+MUSICBRAINZ_NOT_FOUND_CACHE_HOURS_DEFAULT_VALUE = "168"
 NUM_USER_PLAYLISTS_DEFAULT_VALUE = "5"
 PLAYLIST_GEN_SCHED_DEFAULT_VALUE = "3"
 PLAYLIST_PREFIX_DEFAULT_VALUE = "Spotisub - "
 RECOMMEND_GEN_SCHED_DEFAULT_VALUE = "4"
+REIMPORT_WORKERS_DEFAULT_VALUE = "2"
 SAVED_GEN_SCHED_DEFAULT_VALUE = "2"
 SCHEDULER_ENABLED_DEFAULT_VALUE = "1"
 SPOTDL_ENABLED_DEFAULT_VALUE = "0"
@@ -58,6 +66,8 @@ SPOTIPY_CLIENT_ID_DEFAULT_VALUE = ""
 SPOTIPY_CLIENT_SECRET_DEFAULT_VALUE = ""
 SPOTIPY_REDIRECT_URI_DEFAULT_VALUE = "http://127.0.0.1:8080/"
 SUBSONIC_API_BASE_URL_DEFAULT_VALUE = ""
+SUBSONIC_CACHE_CHECK_SECONDS_DEFAULT_VALUE = "60"
+SUBSONIC_CACHE_WORKERS_DEFAULT_VALUE = "4"
 TEXT_COMAPRE_MATCHING_ENABLED_DEFAULT_VALUE = "0"
 
 
@@ -72,4 +82,55 @@ JOB_ST_ID = 'saved_tracks'
 # Cache constants
 CACHE_DIR = os.path.join(os.path.abspath(os.curdir), 'cache')
 SPOTIFY_OBJECT_CACHE_FILENAME = 'spotify_object_cache.pkl'
-SUBSONIC_CACHE_FILENAME = 'subsonic_cache.pkl'
+SPOTIFY_OBJECT_CACHE_MAX_AGE_SECONDS = 43200
+SPOTIFY_OBJECT_CACHE_MAX_LEN = 10000
+SPOTIFY_OBJECT_CACHE_MAX_ROWS = 100000
+SUBSONIC_LEGACY_CACHE_FILENAMES = ('subsonic_cache.pkl', 'subsonic_library.pkl')
+SUBSONIC_LIBRARY_INDEX_PREFIX = 'subsonic_library_'
+SUBSONIC_LIBRARY_INDEX_SUFFIX = '.db'
+SUBSONIC_SONG_FIELDS = ("id", "title", "artist", "artistId", "album",
+                        "albumId", "duration", "musicBrainzId")
+SUBSONIC_INTERNED_FIELDS = ("artist", "artistId", "album", "albumId")
+
+# Spotify track fields read by each import stage, as dotted paths.
+# playlist_items only requests these, a field missing here is refetched
+# one batch at a time by hydrate_tracks or breaks the stage that reads it
+SPOTIFY_TRACK_FIELDS_BY_STAGE = {
+    # generator logging of the fetched tracks
+    "listing": ("name", "artists.name"),
+    # hydrate_tracks refetches tracks without album or isrc
+    "hydration": ("id", "album.uri", "external_ids.isrc"),
+    # match memo and stored matches by uri, mbid by isrc, text by name
+    "matching": ("uri", "name", "artists.name", "external_ids.isrc"),
+    # database.insert_song for tracks, albums and artists
+    "writing": ("id", "uri", "name", "album.uri", "album.name",
+                "artists.uri", "artists.name"),
+    # spotdl downloads of tracks missing from the library
+    "download": ("external_urls.spotify",),
+}
+
+# Spotify request constants
+SPOTIFY_PAGE_LIMIT = 50
+SPOTIFY_TRACKS_BATCH_SIZE = 50
+SPOTIFY_REQUESTS_PER_SECOND = 2
+SPOTIFY_REQUESTS_BURST = 5
+SPOTIFY_PLAYLIST_LISTING_MAX_AGE_SECONDS = 60
+
+# Request budgets shared by concurrent imports
+MUSICBRAINZ_RATE_LIMIT_INTERVAL = 1.0
+MUSICBRAINZ_RATE_LIMIT_REQUESTS = 1
+SUBSONIC_REQUESTS_PER_SECOND = 20
+SUBSONIC_REQUESTS_BURST = 20
+
+# Import pipeline constants, tracks fetched and hydrated ahead of matching
+IMPORT_PIPELINE_BUFFER_SIZE = 100
+
+# Match method constants
+MATCH_METHOD_MBID = "mbid"
+MATCH_METHOD_TEXT = "text"
+MATCH_METHOD_NONE = "none"
+
+# Subsonic connection constants
+SUBSONIC_CIRCUIT_FAILURE_THRESHOLD = 3
+SUBSONIC_CIRCUIT_PROBE_SECONDS = 30
+SUBSONIC_HEALTH_MAX_AGE_SECONDS = 60
@@ -13,14 +13,18 @@ from sqlalchemy import Table
 from sqlalchemy import Column
 from sqlalchemy import Integer
 from sqlalchemy import String
+from sqlalchemy import Text
 from sqlalchemy import MetaData
 from sqlalchemy import DateTime
 from sqlalchemy import func
 from sqlalchemy import text
 from sqlalchemy import desc
 from sqlalchemy import or_
+from sqlalchemy import and_
+from sqlalchemy import case
 from sqlalchemy import distinct
 from sqlalchemy import collate
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 VERSION = "0.3.4"
 VERSIONS = ["0.3.0-alpha-01", "0.3.1", "0.3.3", "0.3.4"]
@@ -34,6 +38,12 @@ SPOTIFY_SONG = 'spotify_song'
 SPOTIFY_ARTIST = 'spotify_artist'
 SPOTIFY_ALBUM = 'spotify_album'
 SPOTIFY_SONG_ARTIST_RELATION = 'spotify_song_artist_relation'
+MUSICBRAINZ_ISRC = 'musicbrainz_isrc'
+SPOTIFY_OBJECT_CACHE = 'spotify_object_cache'
+SPOTIFY_SUBSONIC_MATCH = 'spotify_subsonic_match'
+SPOTIFY_SAVED_TRACK = 'spotify_saved_track'
+
+insert_song_lock = threading.Lock()
 
 
 class Database:
@@ -68,10 +78,10 @@ class Database:
     subsonic_spotify_relation = Table(
         SUBSONIC_SPOTIFY_RELATION, metadata, Column(
             'uuid', String(36), primary_key=True, nullable=False), Column(
-            'subsonic_song_id', String(36), nullable=True), Column(
+            'subsonic_song_id', String(36), nullable=True, index=True), Column(
                 'subsonic_artist_id', String(36), nullable=True), Column(
-                    'spotify_song_uuid', String(36), nullable=True), Column(
-                        'playlist_info_uuid', String(36), nullable=False), Column(
+                    'spotify_song_uuid', String(36), nullable=True, index=True), Column(
+                        'playlist_info_uuid', String(36), nullable=False, index=True), Column(
             'ignored', Integer, nullable=False, default=0))
 
     playlist_info = Table(
@@ -83,6 +93,8 @@ class Database:
                         'import_arg', String(500), nullable=False), Column(
                             'prefix', String(500), nullable=False), Column(
                                 'type', String(36), nullable=False), Column(
+                                    'spotify_snapshot_id', String(100), nullable=True), Column(
+                                        'library_version', String(500), nullable=True), Column(
             'ignored', Integer, nullable=False, default=0))
 
     spotify_song = Table(SPOTIFY_SONG, metadata,
@@ -92,7 +104,7 @@ class Database:
                              primary_key=True,
                              nullable=False),
                          Column(
-                             'album_uuid', String(36), nullable=False),
+                             'album_uuid', String(36), nullable=False, index=True),
                          Column('title', String(500), nullable=False),
                          Column(
                              'spotify_uri',
@@ -122,8 +134,8 @@ class Database:
             String(36),
             primary_key=True,
             nullable=False), Column(
-            'song_relation_uuid', String(36), nullable=False), Column(
-            'artist_relation_uuid', String(36), nullable=False))
+            'song_relation_uuid', String(36), nullable=False, index=True), Column(
+            'artist_relation_uuid', String(36), nullable=False, index=True))
 
     spotify_artist = Table(SPOTIFY_ARTIST, metadata,
                            Column(
@@ -183,10 +195,72 @@ class Database:
                               'ignored', Integer, nullable=False, default=0)
                           )
 
+    musicbrainz_isrc = Table(MUSICBRAINZ_ISRC, metadata,
+                             Column(
+                                 'isrc',
+                                 String(36),
+                                 primary_key=True,
+                                 nullable=False),
+                             Column('mbids', String(2000), nullable=False),
+                             Column(
+                                 'tms_update',
+                                 DateTime(
+                                     timezone=True),
+                                 server_default=func.now(),
+                                 onupdate=func.now(),
+                                 nullable=False)
+                             )
+
+    spotify_object_cache = Table(SPOTIFY_OBJECT_CACHE, metadata,
+                                 Column(
+                                     'spotify_uri',
+                                     String(500),
+                                     primary_key=True,
+                                     nullable=False),
+                                 Column('object', Text, nullable=False),
+                                 Column(
+                                     'tms_insert',
+                                     DateTime(
+                                         timezone=True),
+                                     server_default=func.now(),
+                                     index=True,
+                                     nullable=False)
+                                 )
+
+    spotify_subsonic_match = Table(SPOTIFY_SUBSONIC_MATCH, metadata,
+                                   Column(
+                                       'spotify_uri',
+                                       String(500),
+                                       primary_key=True,
+                                       nullable=False),
+                                   Column('subsonic_song_id', String(36), nullable=True),
+                                   Column('match_method', String(10), nullable=False),
+                                   Column('library_version', String(100), nullable=False),
+                                   Column(
+                                       'tms_update',
+                                       DateTime(
+                                           timezone=True),
+                                       server_default=func.now(),
+                                       onupdate=func.now(),
+                                       nullable=False)
+                                   )
+
+    spotify_saved_track = Table(SPOTIFY_SAVED_TRACK, metadata,
+                                Column(
+                                    'spotify_uri',
+                                    String(500),
+                                    primary_key=True,
+                                    nullable=False),
+                                Column('added_at', String(36), nullable=False),
+                                Column('position', Integer, nullable=False, index=True),
+                                Column('track', Text, nullable=False))
+
 
 def create_db_tables():
     """Create tables"""
     dbms.metadata.create_all(dbms.db_engine)
+    create_missing_columns()
+    create_missing_indexes()
     #temp removed, db upgrade will be reimplemented in a future release
     #upgrade()
 
@@ -228,6 +302,43 @@ def upgrade():
             conn.close()
 
 
+def create_missing_columns():
+    """Add nullable columns added to tables that already exist"""
+    with dbms.db_engine.connect() as conn:
+        for table in dbms.metadata.sorted_tables:
+            query_check = "PRAGMA table_info(" + table.name + ")"
+            existing = [row.name for row in conn.execute(text(query_check))]
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    logging.info('Adding column %s to table %s',
+                                 column.name, table.name)
+                    query = "ALTER TABLE " + table.name + " ADD COLUMN " + \
+                        column.name + " " + column.type.compile(dialect=conn.dialect)
+                    conn.execute(text(query))
+        conn.commit()
+        conn.close()
+
+
+def create_missing_indexes():
+    """Create indexes added to tables that already exist"""
+    with dbms.db_engine.connect() as conn:
+        for table in dbms.metadata.sorted_tables:
+            for index in table.indexes:
+                if check_index(conn, index.name) == 0:
+                    logging.info('Creating index %s on table %s',
+                                 index.name, table.name)
+                    index.create(conn)
+        conn.commit()
+        conn.close()
+
+
+def check_index(conn, index_name):
+    query_check = "SELECT count(name) FROM sqlite_master WHERE type='index' AND name='" + \
+        index_name + "'"
+    count = conn.execute(text(query_check)).scalar()
+    return count
+
+
 def drop_table(conn, table_name):
     """Drops single table"""
     query = "DROP TABLE IF EXISTS " + table_name
@@ -281,7 +392,8 @@ def insert_song(playlist_info, subsonic_track,
                 artist_spotify, track_spotify):
     """Create empty playlist into database"""
     return_dict = None
-    with dbms.db_engine.connect() as conn:
+    # concurrent imports share songs, albums and artists, one writer at a time
+    with insert_song_lock, dbms.db_engine.connect() as conn:
         pl_info = insert_playlist_type(
             conn, playlist_info)
         if pl_info is not None:
@@ -554,7 +666,9 @@ def select_playlist_info_by_uuid(uuid):
             dbms.playlist_info.c.spotify_playlist_uri,
             dbms.playlist_info.c.ignored,
             dbms.playlist_info.c.type,
-            dbms.playlist_info.c.import_arg).where(
+            dbms.playlist_info.c.import_arg,
+            dbms.playlist_info.c.spotify_snapshot_id,
+            dbms.playlist_info.c.library_version).where(
             dbms.playlist_info.c.uuid == uuid)
         stmt.compile()
         cursor = conn.execute(stmt)
@@ -577,7 +691,9 @@ def select_playlist_info_by_uuid_with_conn(conn, uuid):
         dbms.playlist_info.c.spotify_playlist_uri,
         dbms.playlist_info.c.ignored,
         dbms.playlist_info  .c.type,
-        dbms.playlist_info.c.import_arg).where(
+        dbms.playlist_info.c.import_arg,
+        dbms.playlist_info.c.spotify_snapshot_id,
+        dbms.playlist_info.c.library_version).where(
         dbms.playlist_info.c.uuid == uuid)
     stmt.compile()
     cursor = conn.execute(stmt)
@@ -589,6 +705,40 @@ def select_playlist_info_by_uuid_with_conn(conn, uuid):
     return value
 
 
+def reset_playlist_info_sync_state(conn, playlist_info_uuids=None):
+    """forget the last import of these playlists, or of all of them,
+    so the next run imports them even if spotify and the library are unchanged"""
+    stmt = update(dbms.playlist_info)
+    if playlist_info_uuids is not None:
+        stmt = stmt.where(dbms.playlist_info.c.uuid.in_(playlist_info_uuids))
+    stmt = stmt.values(spotify_snapshot_id=None, library_version=None)
+    stmt.compile()
+    conn.execute(stmt)
+
+
+def reset_playlist_sync_state(uuid):
+    """forget the last import of a playlist"""
+    with dbms.db_engine.connect() as conn:
+        reset_playlist_info_sync_state(conn, [uuid])
+        conn.commit()
+        conn.close()
+
+
+def update_playlist_info_sync_state(
+        uuid: str, spotify_snapshot_id: str, library_version: str):
+    """remember the spotify snapshot and library a playlist was last imported with"""
+    with dbms.db_engine.connect() as conn:
+        stmt = update(
+            dbms.playlist_info).where(
+            dbms.playlist_info.c.uuid == uuid).values(
+            spotify_snapshot_id=spotify_snapshot_id,
+            library_version=library_version)
+        stmt.compile()
+        conn.execute(stmt)
+        conn.commit()
+        conn.close()
+
+
 def delete_playlist_relation_by_id(playlist_id: str):
     """delete playlist from database"""
     with dbms.db_engine.connect() as conn:
@@ -992,17 +1142,18 @@ def insert_spotify_song(conn, artist_spotify, track_spotify):
             album = insert_spotify_album(conn, track_spotify["album"])
         if album is not None:
             return_dict["album_ignored"] = (album.ignored == 1)
-            stmt = insert(
+            stmt = sqlite_insert(
                 dbms.spotify_song).values(
                 uuid=str(uuid.uuid4().hex),
                 album_uuid=album.uuid,
                 title=track_spotify["name"],
-                spotify_uri=track_spotify["uri"])
+                spotify_uri=track_spotify["uri"]).on_conflict_do_nothing(
+                index_elements=[dbms.spotify_song.c.spotify_uri])
             stmt.compile()
             conn.execute(stmt)
             song_db = select_spotify_song_by_uri(conn, track_spotify["uri"])
             return_dict["song_uuid"] = song_db.uuid
-            return_dict["song_ignored"] = False
+            return_dict["song_ignored"] = (song_db.ignored == 1)
     elif song_db is not None and song_db.uuid is not None:
         return_dict["song_uuid"] = song_db.uuid
         return_dict["song_ignored"] = (song_db.ignored == 1)
@@ -1060,11 +1211,12 @@ def insert_spotify_artist(conn, artist_spotify):
     """insert spotify artist"""
     artist_db = select_spotify_artist_by_uri(conn, artist_spotify["uri"])
     if artist_db is None:
-        stmt = insert(
+        stmt = sqlite_insert(
             dbms.spotify_artist).values(
             uuid=str(uuid.uuid4().hex),
             name=artist_spotify["name"],
-            spotify_uri=artist_spotify["uri"])
+            spotify_uri=artist_spotify["uri"]).on_conflict_do_nothing(
+            index_elements=[dbms.spotify_artist.c.spotify_uri])
         stmt.compile()
         conn.execute(stmt)
         return select_spotify_artist_by_uri(conn, artist_spotify["uri"])
@@ -1075,11 +1227,12 @@ def insert_spotify_album(conn, album_spotify):
     """insert spotify artist"""
     album = select_spotify_album_by_uri(conn, album_spotify["uri"])
     if album is None:
-        stmt = insert(
+        stmt = sqlite_insert(
             dbms.spotify_album).values(
             uuid=str(uuid.uuid4().hex),
             name=album_spotify["name"],
-            spotify_uri=album_spotify["uri"])
+            spotify_uri=album_spotify["uri"]).on_conflict_do_nothing(
+            index_elements=[dbms.spotify_album.c.spotify_uri])
         stmt.compile()
         conn.execute(stmt)
         return select_spotify_album_by_uri(conn, album_spotify["uri"])
@@ -1242,6 +1395,186 @@ def insert_or_update_config(conn, name: str, value: str):
     conn.execute(stmt)
 
 
+def select_musicbrainz_isrc(isrc: str):
+    """select cached musicbrainz recordings by isrc"""
+    value = None
+    with dbms.db_engine.connect() as conn:
+        stmt = select(
+            dbms.musicbrainz_isrc.c.isrc,
+            dbms.musicbrainz_isrc.c.mbids,
+            dbms.musicbrainz_isrc.c.tms_update).where(
+            dbms.musicbrainz_isrc.c.isrc == isrc)
+        stmt.compile()
+        cursor = conn.execute(stmt)
+        records = cursor.fetchall()
+
+        for row in records:
+            value = row
+        cursor.close()
+        conn.close()
+
+    return value
+
+
+def insert_or_update_musicbrainz_isrc(isrc: str, mbids: list):
+    """cache musicbrainz recordings by isrc, an empty list means not found"""
+    with dbms.db_engine.connect() as conn:
+        stmt = sqlite_insert(
+            dbms.musicbrainz_isrc).values(
+            isrc=isrc,
+            mbids=",".join(mbids))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[dbms.musicbrainz_isrc.c.isrc],
+            set_=dict(mbids=stmt.excluded.mbids, tms_update=func.now()))
+        stmt.compile()
+        conn.execute(stmt)
+        conn.commit()
+        conn.close()
+
+
+def select_spotify_subsonic_match(spotify_uri: str):
+    """select the library song a spotify track was matched with"""
+    value = None
+    with dbms.db_engine.connect() as conn:
+        stmt = select(
+            dbms.spotify_subsonic_match.c.spotify_uri,
+            dbms.spotify_subsonic_match.c.subsonic_song_id,
+            dbms.spotify_subsonic_match.c.match_method,
+            dbms.spotify_subsonic_match.c.library_version).where(
+            dbms.spotify_subsonic_match.c.spotify_uri == spotify_uri)
+        stmt.compile()
+        cursor = conn.execute(stmt)
+        records = cursor.fetchall()
+
+        for row in records:
+            value = row
+        cursor.close()
+        conn.close()
+
+    return value
+
+
+def insert_or_update_spotify_subsonic_match(
+        spotify_uri: str, subsonic_song_id, match_method: str, library_version: str):
+    """remember the library song a spotify track matched, None when not found"""
+    with dbms.db_engine.connect() as conn:
+        stmt = sqlite_insert(
+            dbms.spotify_subsonic_match).values(
+            spotify_uri=spotify_uri,
+            subsonic_song_id=subsonic_song_id,
+            match_method=match_method,
+            library_version=library_version)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[dbms.spotify_subsonic_match.c.spotify_uri],
+            set_=dict(
+                subsonic_song_id=stmt.excluded.subsonic_song_id,
+                match_method=stmt.excluded.match_method,
+                library_version=stmt.excluded.library_version,
+                tms_update=func.now()))
+        stmt.compile()
+        conn.execute(stmt)
+        conn.commit()
+        conn.close()
+
+
+def select_spotify_objects(spotify_uris: list, max_age_seconds: int):
+    """select cached spotify objects younger than max_age_seconds"""
+    CHUNK_SIZE = 500
+    values = {}
+    with dbms.db_engine.connect() as conn:
+        for i in range(0, len(spotify_uris), CHUNK_SIZE):
+            stmt = select(
+                dbms.spotify_object_cache.c.spotify_uri,
+                dbms.spotify_object_cache.c.object).where(
+                dbms.spotify_object_cache.c.spotify_uri.in_(
+                    spotify_uris[i:i + CHUNK_SIZE]),
+                dbms.spotify_object_cache.c.tms_insert > func.datetime(
+                    'now', '-' + str(max_age_seconds) + ' seconds'))
+            stmt.compile()
+            cursor = conn.execute(stmt)
+            records = cursor.fetchall()
+
+            for row in records:
+                values[row.spotify_uri] = row.object
+            cursor.close()
+        conn.close()
+
+    return values
+
+
+def insert_or_update_spotify_objects(objects: dict):
+    """cache serialized spotify objects by uri, one row per object"""
+    if len(objects) == 0:
+        return
+    with dbms.db_engine.connect() as conn:
+        stmt = sqlite_insert(dbms.spotify_object_cache)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[dbms.spotify_object_cache.c.spotify_uri],
+            set_=dict(object=stmt.excluded.object, tms_insert=func.now()))
+        stmt.compile()
+        conn.execute(
+            stmt, [{"spotify_uri": spotify_uri, "object": value}
+                   for spotify_uri, value in objects.items()])
+        conn.commit()
+        conn.close()
+
+
+def delete_expired_spotify_objects(max_age_seconds: int, max_rows: int):
+    """evict expired spotify objects and the oldest ones above max_rows"""
+    with dbms.db_engine.connect() as conn:
+        stmt1 = delete(dbms.spotify_object_cache).where(
+            dbms.spotify_object_cache.c.tms_insert <= func.datetime(
+                'now', '-' + str(max_age_seconds) + ' seconds'))
+        stmt1.compile()
+        newest = select(dbms.spotify_object_cache.c.spotify_uri).order_by(
+            desc(dbms.spotify_object_cache.c.tms_insert)).limit(max_rows)
+        stmt2 = delete(dbms.spotify_object_cache).where(
+            dbms.spotify_object_cache.c.spotify_uri.not_in(newest.scalar_subquery()))
+        stmt2.compile()
+        conn.execute(stmt1)
+        conn.execute(stmt2)
+        conn.commit()
+        conn.close()
+
+
+def select_spotify_saved_tracks():
+    """select the stored saved tracks listing, newest first"""
+    with dbms.db_engine.connect() as conn:
+        stmt = select(
+            dbms.spotify_saved_track.c.spotify_uri,
+            dbms.spotify_saved_track.c.added_at,
+            dbms.spotify_saved_track.c.position,
+            dbms.spotify_saved_track.c.track).order_by(
+            dbms.spotify_saved_track.c.position)
+        stmt.compile()
+        cursor = conn.execute(stmt)
+        records = cursor.fetchall()
+        cursor.close()
+        conn.close()
+    return records
+
+
+def insert_or_update_spotify_saved_tracks(values: list, replace_all=False):
+    """store saved tracks by uri, replace_all drops the previous listing first"""
+    with dbms.db_engine.connect() as conn:
+        if replace_all:
+            stmt1 = delete(dbms.spotify_saved_track)
+            stmt1.compile()
+            conn.execute(stmt1)
+        if len(values) > 0:
+            stmt2 = sqlite_insert(dbms.spotify_saved_track)
+            stmt2 = stmt2.on_conflict_do_update(
+                index_elements=[dbms.spotify_saved_track.c.spotify_uri],
+                set_=dict(
+                    added_at=stmt2.excluded.added_at,
+                    position=stmt2.excluded.position,
+                    track=stmt2.excluded.track))
+            stmt2.compile()
+            conn.execute(stmt2, values)
+        conn.commit()
+        conn.close()
+
+
 def insert_spotify_song_artist_relation(
         conn, song_uuid: int, artist_uuid: int):
     """insert spotify song artist relation"""
@@ -1504,8 +1837,9 @@ def select_all_playlists(
         stmt.compile()
         cursor = conn.execute(stmt)
         rows = cursor.fetchall()
+        counts = get_playlists_counts(conn, [row.uuid for row in rows])
         for row in rows:
-            total, matched, missing = get_playlist_counts(conn, row.uuid)
+            total, matched, missing = counts.get(row.uuid, (0, 0, 0))
             record = {}
             record["uuid"] = row.uuid
             record["subsonic_playlist_id"] = row.subsonic_playlist_id
@@ -1547,27 +1881,58 @@ def count_playlists(conn):
 
 def get_playlist_counts(conn, pl_info_uuid):
     """select count songs from database"""
-    total = count_songs(
-        conn,
-        missing_only=False,
-        search=None,
-        song_uuid=None,
-        subsonic_song_id=None,
-        playlist_uuid=pl_info_uuid,
-        is_outer=False)
+    return get_playlists_counts(conn, [pl_info_uuid]).get(
+        pl_info_uuid, (0, 0, 0))
+
+
+def get_playlists_counts(conn, pl_info_uuids):
+    """select total, matched and missing songs of many playlists in one query"""
+    counts = {}
+    if len(pl_info_uuids) == 0:
+        return counts
+    is_missing = case(
+        (and_(dbms.subsonic_spotify_relation.c.subsonic_song_id == None,
+              dbms.subsonic_spotify_relation.c.subsonic_artist_id == None), 1),
+        else_=0)
+    stmt = select(
+        dbms.playlist_info.c.uuid.label('playlist_uuid'),
+        func.max(is_missing).label('missing'))
+    stmt = stmt.join(
+        dbms.subsonic_spotify_relation,
+        dbms.subsonic_spotify_relation.c.playlist_info_uuid == dbms.playlist_info.c.uuid)
+    stmt = stmt.join(
+        dbms.spotify_song,
+        dbms.subsonic_spotify_relation.c.spotify_song_uuid == dbms.spotify_song.c.uuid)
+    stmt = stmt.join(
+        dbms.spotify_album,
+        dbms.spotify_song.c.album_uuid == dbms.spotify_album.c.uuid)
+    stmt = stmt.join(
+        dbms.spotify_song_artist_relation,
+        dbms.spotify_song.c.uuid == dbms.spotify_song_artist_relation.c.song_relation_uuid)
+    stmt = stmt.join(
+        dbms.spotify_artist,
+        dbms.spotify_song_artist_relation.c.artist_relation_uuid == dbms.spotify_artist.c.uuid)
+    stmt = stmt.where(dbms.playlist_info.c.uuid.in_(pl_info_uuids))
+    stmt = stmt.group_by(
+        dbms.subsonic_spotify_relation.c.spotify_song_uuid,
+        dbms.playlist_info.c.uuid)
+    songs = stmt.subquery()
 
-    missing = count_songs(
-        conn,
-        missing_only=True,
-        search=None,
-        song_uuid=None,
-        subsonic_song_id=None,
-        playlist_uuid=pl_info_uuid,
-        is_outer=False)
+    stmt = select(
+        songs.c.playlist_uuid,
+        func.count().label('total'),
+        func.sum(songs.c.missing).label('missing')).group_by(
+        songs.c.playlist_uuid)
+    stmt.compile()
+    cursor = conn.execute(stmt)
+    records = cursor.fetchall()
 
-    matched = total - missing
+    for row in records:
+        counts[row.playlist_uuid] = (
+            row.total, row.total - row.missing, row.missing)
+    cursor.close()
 
-    return total, matched, missing
+    return counts
 
 
 def update_ignored_song(uuid, value):
@@ -1578,6 +1943,8 @@ def update_ignored_song(uuid, value):
             ignored=value)
         stmt.compile()
         conn.execute(stmt)
+        # any playlist may contain it
+        reset_playlist_info_sync_state(conn)
         conn.commit()
         conn.close()
 
@@ -1591,6 +1958,8 @@ def update_ignored_artist(uuid, value):
 
         stmt.compile()
         conn.execute(stmt)
+        # any playlist may contain it
+        reset_playlist_info_sync_state(conn)
         conn.commit()
         conn.close()
 
@@ -1604,6 +1973,8 @@ def update_ignored_album(uuid, value):
 
         stmt.compile()
         conn.execute(stmt)
+        # any playlist may contain it
+        reset_playlist_info_sync_state(conn)
         conn.commit()
         conn.close()
 
@@ -1617,6 +1988,9 @@ def update_ignored_song_pl(uuid, value):
 
         stmt.compile()
         conn.execute(stmt)
+        reset_playlist_info_sync_state(
+            conn, select(dbms.subsonic_spotify_relation.c.playlist_info_uuid).where(
+                dbms.subsonic_spotify_relation.c.uuid == uuid))
         conn.commit()
         conn.close()
 
@@ -1630,6 +2004,7 @@ def update_ignored_playlist(uuid, value):
 
         stmt.compile()
         conn.execute(stmt)
+        reset_playlist_info_sync_state(conn, [uuid])
         conn.commit()
         conn.close()
 
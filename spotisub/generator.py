@@ -1,12 +1,15 @@
 """Subsonic generator"""
 import logging
 import os
+import json
 import random
 import time
 import re
 import string
 import math
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 from datetime import datetime
 from datetime import timedelta
 from flask_apscheduler import APScheduler
@@ -78,14 +81,10 @@ def scan_user_saved_tracks():
     subsonic_helper.generate_playlist(playlist_info)
 
 
-def scan_user_playlists(offset=0):
+def scan_user_playlists():
     """get list of user playlists"""
-    REQUEST_LIMIT = 50
-    sp = spotipy_helper.get_spotipy_client()
-    playlist_result = sp.current_user_playlists(limit=REQUEST_LIMIT, offset=offset)
-
-    for item in playlist_result['items']:
-        if item is not None and item['name'] is not None and item['name'].strip() != '':
+    for item in spotipy_helper.get_user_playlist_listing().items:
+        if item['name'] is not None and item['name'].strip() != '':
             playlist_info = {}
             playlist_info["name"] = item['name'].strip()
             playlist_info["spotify_uri"] = item["uri"]
@@ -93,10 +92,6 @@ def scan_user_playlists(offset=0):
             playlist_info["import_arg"] = item['name']
             subsonic_helper.generate_playlist(playlist_info)
 
-    if len(playlist_result['items']) != 0:
-        scan_user_playlists(offset=offset + REQUEST_LIMIT)
-    return
-
 
 def init_artists_top_tracks():
     """all artists top tracks"""
@@ -437,9 +432,16 @@ def get_user_saved_tracks_run(uuid):
         playlist_info["type"] = constants.JOB_ST_ID
         playlist_info["import_arg"] = ""
         sp = spotipy_helper.get_spotipy_client()
-        result = dict({'tracks': []})
-        result = get_user_saved_tracks_playlist(result)
-        subsonic_helper.write_playlist(sp, playlist_info, result)
+        tracks, snapshot_id = sync_user_saved_tracks(sp)
+        playlist_info["spotify_snapshot_id"] = snapshot_id
+        if subsonic_helper.is_playlist_unchanged(
+                playlist_info_db, None, snapshot_id):
+            logging.info(
+                '(%s) Saved tracks and your music library are unchanged since the last import, skipping',
+                str(threading.current_thread().ident))
+        else:
+            subsonic_helper.write_playlist(
+                sp, playlist_info, dict({'tracks': tracks}))
 
     if os.environ.get(constants.SAVED_GEN_SCHED,
                       constants.SAVED_GEN_SCHED_DEFAULT_VALUE) == "0":
@@ -460,34 +462,39 @@ def get_user_playlists(uuid):
             "Skipping thread execution becase a full reimport process is running")
 
 
-def get_user_playlists_run(uuid, offset=0):
+def get_user_playlists_run(uuid):
     """get user playlists"""
     playlist_info_db = database.select_playlist_info_by_uuid(uuid)
     if playlist_info_db is not None and playlist_info_db.uuid is not None:
 
         sp = spotipy_helper.get_spotipy_client()
 
-        playlist_result = sp.current_user_playlists(
-            limit=50, offset=offset)
-
-        for item in playlist_result['items']:
-            if item['name'] is not None and item['name'].strip() != '' and (playlist_info_db.import_arg is None or (
-                    playlist_info_db.import_arg is not None and item['name'].lower().strip() == playlist_info_db.import_arg.lower().strip())):
-                playlist_info = {}
-                playlist_info["uuid"] = playlist_info_db.uuid
-                playlist_info["name"] = item['name'].strip()
-                playlist_info["spotify_uri"] = item["uri"]
-                playlist_info["type"] = constants.JOB_UP_ID
-                playlist_info["import_arg"] = item['name']
+        listing = spotipy_helper.get_user_playlist_listing()
+        if playlist_info_db.import_arg is None:
+            items = [item for item in listing.items
+                     if item['name'] is not None and item['name'].strip() != '']
+        else:
+            items = listing.by_name.get(
+                spotipy_helper.get_playlist_name_key(playlist_info_db.import_arg), [])
+        for item in items:
+            playlist_info = {}
+            playlist_info["uuid"] = playlist_info_db.uuid
+            playlist_info["name"] = item['name'].strip()
+            playlist_info["spotify_uri"] = item["uri"]
+            playlist_info["type"] = constants.JOB_UP_ID
+            playlist_info["import_arg"] = item['name']
+            playlist_info["spotify_snapshot_id"] = item.get("snapshot_id")
+            if subsonic_helper.is_playlist_unchanged(
+                    playlist_info_db, item["uri"], item.get("snapshot_id")):
                 logging.info(
-                    '(%s) Importing playlist: %s', str(
-                        threading.current_thread().ident), item['name'])
-                result = dict({'tracks': []})
-                result = get_playlist_tracks(item, result)
-                subsonic_helper.write_playlist(sp, playlist_info, result)
-
-        if len(playlist_result['items']) != 0:
-            get_user_playlists_run(uuid, offset=offset + 50)
+                    '(%s) Playlist %s and your music library are unchanged since the last import, skipping',
+                    str(threading.current_thread().ident), item['name'])
+                continue
+            logging.info(
+                '(%s) Importing playlist: %s', str(
+                    threading.current_thread().ident), item['name'])
+            result = dict({'tracks': iterate_playlist_tracks(item)})
+            subsonic_helper.write_playlist(sp, playlist_info, result)
 
     if os.environ.get(constants.PLAYLIST_GEN_SCHED,
                       constants.PLAYLIST_GEN_SCHED_DEFAULT_VALUE) == "0":
@@ -509,28 +516,83 @@ def get_user_playlists_run(uuid, offset=0):
                 scheduler.remove_job(id=constants.JOB_UP_ID)
 
 
-def get_user_saved_tracks_playlist(result, offset_tracks=0):
-    """get user saved tracks playlist"""
-    sp = spotipy_helper.get_spotipy_client()
-    response_tracks = sp.current_user_saved_tracks(
-        offset=offset_tracks,
-        limit=50)
-    for track_item in response_tracks['items']:
-        if "track" in track_item:
-            track = track_item['track']
-            if track is not None:
-                logging.info(
-                    '(%s) Found %s - %s inside your saved tracks',
-                    str(threading.current_thread().ident),
-                    track['artists'][0]['name'],
-                    track['name'])
-                if track is not None:
-                    result["tracks"].append(track)
-    time.sleep(2)
-    if len(response_tracks['items']) != 0:
-        result = get_user_saved_tracks_playlist(
-            result, offset_tracks=offset_tracks + 50)
-    return result
+def get_user_saved_track_items(sp, watermark=None, stored_added_at=None):
+    """saved track items newest first, stopping at the stored watermark"""
+    items = []
+    total = 0
+    for response_tracks in spotipy_helper.iterate_pages(sp.current_user_saved_tracks):
+        total = response_tracks['total']
+        for track_item in response_tracks['items']:
+            track = track_item['track'] if "track" in track_item else None
+            if track is None:
+                continue
+            if watermark is not None and (track_item['added_at'] < watermark or (
+                    track_item['added_at'] == watermark
+                    and stored_added_at.get(track['uri']) == watermark)):
+                return items, total
+            logging.info(
+                '(%s) Found %s - %s inside your saved tracks',
+                str(threading.current_thread().ident),
+                track['artists'][0]['name'],
+                track['name'])
+            items.append(track_item)
+    return items, total
+
+
+def compact_spotify_track(track):
+    """saved track without its market lists, which are most of its size"""
+    track = dict(track)
+    track.pop("available_markets", None)
+    if "album" in track and track["album"] is not None:
+        track["album"] = dict(track["album"])
+        track["album"].pop("available_markets", None)
+    return track
+
+
+def sync_user_saved_tracks(sp):
+    """saved tracks newest first and a snapshot id of the listing,
+    only tracks added since the last sync are downloaded"""
+    stored = database.select_spotify_saved_tracks()
+    stored_added_at = {row.spotify_uri: row.added_at for row in stored}
+    watermark = max(stored_added_at.values()) if len(stored) > 0 else None
+
+    items, total = get_user_saved_track_items(sp, watermark, stored_added_at)
+    new_uris = set(track_item['track']['uri'] for track_item in items)
+    incremental = watermark is not None and total == len(
+        new_uris.union(stored_added_at.keys()))
+    if watermark is not None and not incremental:
+        # removed tracks don't show up when paging from the newest one
+        logging.info(
+            '(%s) Saved tracks count changed from %s to %s, reloading all of them',
+            str(threading.current_thread().ident), len(stored), total)
+        items, total = get_user_saved_track_items(sp)
+        new_uris = set(track_item['track']['uri'] for track_item in items)
+
+    first_position = stored[0].position - len(items) if incremental else 0
+    values = []
+    tracks = []
+    for position, track_item in enumerate(items, first_position):
+        track = compact_spotify_track(track_item['track'])
+        values.append({"spotify_uri": track["uri"],
+                       "added_at": track_item['added_at'],
+                       "position": position,
+                       "track": json.dumps(track)})
+        tracks.append(track)
+    database.insert_or_update_spotify_saved_tracks(
+        values, replace_all=not incremental)
+    if incremental:
+        logging.info(
+            '(%s) Found %s new saved tracks since the last sync',
+            str(threading.current_thread().ident), len(items))
+        for row in stored:
+            if row.spotify_uri not in new_uris:
+                tracks.append(json.loads(row.track))
+
+    snapshot_id = None
+    if len(tracks) > 0:
+        newest_added_at = values[0]["added_at"] if len(values) > 0 else watermark
+        snapshot_id = str(total) + ":" + newest_added_at + ":" + tracks[0]["uri"]
+    return tracks, snapshot_id
 
 
 def get_artist(name):
@@ -543,73 +605,60 @@ def get_artist(name):
     return None
 
 
-def get_playlist_tracks(item, result, offset_tracks=0):
-    """get playlist tracks"""
-    sp = spotipy_helper.get_spotipy_client()
-    response_tracks = sp.playlist_items(
-        item['id'],
-        offset=offset_tracks,
-        fields='items.track.id,items.track.name,items.track.artists,total',
-        limit=50,
-        additional_types=['track'])
-    for track_item in response_tracks['items']:
-        track = track_item['track']
-        logging.info(
-            '(%s) Found %s - %s inside playlist %s',
-            str(threading.current_thread().ident),
-            track['artists'][0]['name'],
-            track['name'],
-            item['name'])
-        if track is not None:
-            result["tracks"].append(track)
-    time.sleep(2)
-    if len(response_tracks['items']) != 0:
-        result = get_playlist_tracks(
-            item, result, offset_tracks=offset_tracks + 50)
-    return result
-
-
-def get_user_playlist_by_name(playlist_name, offset=0):
-    """get user playlist by name"""
+def get_playlist_items_fields():
+    """playlist_items fields filter with the track fields every import stage reads"""
+    paths = []
+    for fields in constants.SPOTIFY_TRACK_FIELDS_BY_STAGE.values():
+        for field in fields:
+            if "items.track." + field not in paths:
+                paths.append("items.track." + field)
+    return utils.generate_spotify_fields(paths + ["total", "next"])
+
+
+def iterate_playlist_tracks(item):
+    """playlist tracks, yielded page by page as they are downloaded"""
     sp = spotipy_helper.get_spotipy_client()
-    playlist_result = sp.current_user_playlists(limit=50, offset=offset)
+    for response_tracks in spotipy_helper.iterate_pages(
+            sp.playlist_items,
+            item['id'],
+            fields=get_playlist_items_fields(),
+            additional_types=['track']):
+        for track_item in response_tracks['items']:
+            track = track_item['track']
+            if track is not None:
+                logging.info(
+                    '(%s) Found %s - %s inside playlist %s',
+                    str(threading.current_thread().ident),
+                    track['artists'][0]['name'],
+                    track['name'],
+                    item['name'])
+                yield track
 
-    name_found = None
 
-    for item in playlist_result['items']:
-        if (item['name'] is not None and item['name'].strip() != ''
-            and (playlist_name is None
-            or (playlist_name is not None
-                and item['name'].lower().strip() == playlist_name.lower().strip()))):
-            name_found = item['name'].strip()
-    if name_found is None and len(playlist_result['items']) != 0:
-        name_found = get_user_playlist_by_name(
-            playlist_name, offset=offset + 50)
-    return name_found
+def get_user_playlist_by_name(playlist_name):
+    """get user playlist by name"""
+    listing = spotipy_helper.get_user_playlist_listing()
+    if playlist_name is None:
+        items = [item for item in listing.items
+                 if item['name'] is not None and item['name'].strip() != '']
+    else:
+        items = listing.by_name.get(
+            spotipy_helper.get_playlist_name_key(playlist_name), [])
+    if len(items) > 0:
+        return items[0]['name'].strip()
+    return None
 
 
-def count_user_playlists(count, offset=0):
+def count_user_playlists(count):
     """count user playlists"""
-    sp = spotipy_helper.get_spotipy_client()
-    playlist_result = sp.current_user_playlists(limit=50, offset=offset)
-    count = count + len(playlist_result['items'])
+    return count + len(spotipy_helper.get_user_playlist_listing().items)
 
-    if len(playlist_result['items']) != 0:
-        count = count_user_playlists(count, offset=offset + 50)
-    return count
 
-
-def get_user_playlists_array(array, offset=0):
+def get_user_playlists_array(array):
     """get list of user playlists"""
-    sp = spotipy_helper.get_spotipy_client()
-    playlist_result = sp.current_user_playlists(limit=50, offset=offset)
-
-    for item in playlist_result['items']:
+    for item in spotipy_helper.get_user_playlist_listing().items:
         if item['name'] is not None and item['name'].strip() != '':
             array.append(item)
-
-    if len(playlist_result['items']) != 0:
-        array = get_user_playlists_array(array, offset=offset + 50)
     return array
 
 
@@ -623,6 +672,8 @@ def reimport(uuid):
             timedelta_sec = timedelta(seconds=30)
             return playlist_info
     if playlist_info is not None:
+        # a manual reimport doesn't skip unchanged playlists
+        database.reset_playlist_sync_state(uuid)
         if playlist_info.type == constants.JOB_AR_ID:
             # (Dec 2024) recommendations API is deprecated
             # https://developer.spotify.com/blog/2024-11-27-changes-to-the-web-api
@@ -785,53 +836,93 @@ def reimport_all():
 
 def reimport_all_thread():
     """Used to reimport everything"""
-    import_all_user_saved_tracks()
-    # (Dec 2024) recommendations API is deprecated
-    # https://developer.spotify.com/blog/2024-11-27-changes-to-the-web-api
-    # import_all_my_recommendations()
-    # import_all_artists_recommendations()
-    if os.environ.get(constants.ARTIST_PLAYLIST_ENABLED, constants.ARTIST_PLAYLIST_ENABLED) == "1":
-        import_all_artists_top_tracks()
-    import_all_user_playlists()
+    # tracks shared by several playlists are matched once per run
+    subsonic_helper.start_match_memo()
+    # the playlist listing is fetched once, not once per playlist
+    spotipy_helper.start_playlist_listing_run()
+    workers = int(os.environ.get(
+        constants.REIMPORT_WORKERS,
+        constants.REIMPORT_WORKERS_DEFAULT_VALUE))
+    try:
+        with ThreadPoolExecutor(
+                max_workers=max(workers, 1),
+                thread_name_prefix='reimport_worker') as executor:
+            futures = import_all_user_saved_tracks(executor)
+            # (Dec 2024) recommendations API is deprecated
+            # https://developer.spotify.com/blog/2024-11-27-changes-to-the-web-api
+            # futures.extend(import_all_my_recommendations(executor))
+            # futures.extend(import_all_artists_recommendations(executor))
+            if os.environ.get(constants.ARTIST_PLAYLIST_ENABLED, constants.ARTIST_PLAYLIST_ENABLED) == "1":
+                futures.extend(import_all_artists_top_tracks(executor))
+            futures.extend(import_all_user_playlists(executor))
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception:  # pylint: disable=broad-exception-caught
+                    # one failed playlist doesn't stop the others
+                    utils.write_exception()
+    finally:
+        spotipy_helper.stop_playlist_listing_run()
+        memo = subsonic_helper.stop_match_memo()
+        logging.info(
+            '(%s) Reimport matched %s unique tracks, %s lookups saved by reusing matches',
+            str(threading.current_thread().ident),
+            len(memo.matches),
+            memo.hits)
 
 
-def import_all_user_saved_tracks():
+def import_all_user_saved_tracks(executor):
+    futures = []
     playlist_infos = database.select_playlist_info_by_type(
         constants.JOB_ST_ID)
     if len(playlist_infos) > 0:
-        get_user_saved_tracks_run(playlist_infos[0].uuid)
+        futures.append(executor.submit(
+            get_user_saved_tracks_run, playlist_infos[0].uuid))
+    return futures
 
 
-def import_all_my_recommendations():
+def import_all_my_recommendations(executor):
+    futures = []
     playlist_infos = database.select_playlist_info_by_type(
         constants.JOB_MR_ID)
     if len(playlist_infos) > 0:
         for playlist_info in playlist_infos:
-            my_recommendations_run(playlist_info.uuid)
+            futures.append(executor.submit(
+                my_recommendations_run, playlist_info.uuid))
+    return futures
 
 
-def import_all_artists_recommendations():
+def import_all_artists_recommendations(executor):
+    futures = []
     playlist_infos = database.select_playlist_info_by_type(
         constants.JOB_AR_ID)
     if len(playlist_infos) > 0:
         for playlist_info in playlist_infos:
-            show_recommendations_for_artist_run(playlist_info.uuid)
+            futures.append(executor.submit(
+                show_recommendations_for_artist_run, playlist_info.uuid))
+    return futures
 
 
-def import_all_artists_top_tracks():
+def import_all_artists_top_tracks(executor):
+    futures = []
     playlist_infos = database.select_playlist_info_by_type(
         constants.JOB_ATT_ID)
     if len(playlist_infos) > 0:
         for playlist_info in playlist_infos:
-            artist_top_tracks_run(playlist_info.uuid)
+            futures.append(executor.submit(
+                artist_top_tracks_run, playlist_info.uuid))
+    return futures
 
 
-def import_all_user_playlists():
+def import_all_user_playlists(executor):
+    futures = []
     playlist_infos = database.select_playlist_info_by_type(
         constants.JOB_UP_ID)
     if len(playlist_infos) > 0:
         for playlist_info in playlist_infos:
-            get_user_playlists_run(playlist_info.uuid)
+            futures.append(executor.submit(
+                get_user_playlists_run, playlist_info.uuid))
+    return futures
 
 
 scheduler.add_job(
@@ -843,6 +934,15 @@ scheduler.add_job(
     max_instances=1
 )
 
+scheduler.add_job(
+    func=subsonic_helper.evict_spotify_cache,
+    trigger="interval",
+    hours=12,
+    id="evict_spotify_cache",
+    replace_existing=True,
+    max_instances=1
+)
+
 scheduler.add_job(
     func=init_jobs,
     trigger="interval",
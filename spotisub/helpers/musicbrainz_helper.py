@@ -1,11 +1,16 @@
 """Musicbrainz helper"""
-import time
+import os
 import logging
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
 
 
 import musicbrainzngs
 from musicbrainzngs.musicbrainz import ResponseError
 from spotisub import utils
+from spotisub import constants
+from spotisub import database
 
 
 # Disabling musicbrainz INFO log as we don't want to see ugly infos in the
@@ -18,27 +23,60 @@ musicbrainzngs.set_useragent(
     "0.1",
     "http://example.com/music")
 
-def get_mbids_from_isrc(isrc: str) -> list:
+# musicbrainzngs throttles every thread through one shared limiter
+musicbrainzngs.set_rate_limit(
+    limit_or_interval=constants.MUSICBRAINZ_RATE_LIMIT_INTERVAL,
+    new_requests=constants.MUSICBRAINZ_RATE_LIMIT_REQUESTS)
+
+def get_cached_mbids(isrc: str) -> list | None:
+    """mbids cached for the isrc, None if missing or expired"""
+    cached = database.select_musicbrainz_isrc(isrc)
+    if cached is None:
+        return None
+    mbids = [mbid for mbid in cached.mbids.split(",") if mbid != ""]
+    if len(mbids) > 0:
+        hours = os.environ.get(
+            constants.MUSICBRAINZ_CACHE_HOURS,
+            constants.MUSICBRAINZ_CACHE_HOURS_DEFAULT_VALUE)
+    else:
+        hours = os.environ.get(
+            constants.MUSICBRAINZ_NOT_FOUND_CACHE_HOURS,
+            constants.MUSICBRAINZ_NOT_FOUND_CACHE_HOURS_DEFAULT_VALUE)
+    # sqlite stores CURRENT_TIMESTAMP as naive UTC
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if cached.tms_update + timedelta(hours=int(hours)) < now:
+        return None
+    return mbids
+
+
+def get_mbids_from_isrc(isrc: str) -> list | None:
+    """musicbrainz recordings of the isrc, None if the lookup failed"""
     isrc = isrc.replace('-', '').upper()
 
+    mbids = get_cached_mbids(isrc)
+    if mbids is not None:
+        return mbids
+
     try:
         res = musicbrainzngs.get_recordings_by_isrc(isrc)
-        time.sleep(0.25)
     except ResponseError as e:
         if "404" in str(e):
             logging.warning(f'Spotify track with ISRC: {isrc} was not found in the MusicBrainz database. Consider manually submitting it.')
+            database.insert_or_update_musicbrainz_isrc(isrc, [])
+            return []
         elif "400" in str(e):
             logging.error(f'HTTP Error 400 from MusicBrainz API for ISRC: {isrc}.')
         else:
             utils.write_exception()
-        return []
+        return None
     except Exception:
         utils.write_exception()
-        return []
+        return None
+
+    mbids = []
+    if "isrc" in res and "recording-list" in res["isrc"]:
+        mbids = list(map(lambda rec: rec["id"], res["isrc"]["recording-list"]))
 
-    if "isrc" not in res:
-        return []
-    if "recording-list" not in res["isrc"]:
-        return []
+    database.insert_or_update_musicbrainz_isrc(isrc, mbids)
 
-    return list(map(lambda rec: rec["id"], res["isrc"]["recording-list"]))
+    return mbids
@@ -1,14 +1,65 @@
 """Spotipy helper"""
 import os
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import spotipy
+from expiringdict import ExpiringDict
 from spotipy import SpotifyOAuth
+from spotipy.exceptions import SpotifyException
 from spotisub import spotisub
 from spotisub import constants
+from spotisub.classes import PlaylistListing
 from spotisub.exceptions import SpotifyApiException
 
 
+class TokenBucket:
+    """request budget shared by threads, acquire blocks until a request may be sent"""
+
+    def __init__(self, rate, capacity):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        """take one token, waiting for the bucket to refill if needed"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now > self.updated:
+                    self.tokens = min(
+                        self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                if self.tokens >= 1:
+                    self.tokens = self.tokens - 1
+                    return
+                wait = (self.updated - now) + (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """empty the bucket and refill it only after seconds, like a Retry-After"""
+        with self.lock:
+            self.tokens = 0
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+
 SP = None
 
+rate_limiter = TokenBucket(
+    constants.SPOTIFY_REQUESTS_PER_SECOND,
+    constants.SPOTIFY_REQUESTS_BURST)
+page_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix='spotify_page')
+playlist_listing_cache = ExpiringDict(
+    max_len=1, max_age_seconds=constants.SPOTIFY_PLAYLIST_LISTING_MAX_AGE_SECONDS)
+playlist_listing_lock = threading.Lock()
+playlist_listing_run = False
+run_playlist_listing = None
+
 
 def get_secrets():
     """Get Spotify api keys from env vars"""
@@ -54,4 +105,121 @@ def get_spotipy_client():
     return SP
 
 
+def get_retry_after(exception, attempt):
+    """Seconds to wait after a 429, from the Retry-After header if present"""
+    headers = getattr(exception, "headers", None)
+    if headers is not None:
+        for key, value in headers.items():
+            if key.lower() == "retry-after":
+                try:
+                    return max(int(value), 1)
+                except (TypeError, ValueError):
+                    break
+    return 2 ** attempt
+
+
+def call_with_retry_after(function, *args, **kwargs):
+    """Call a spotipy function within the request budget,
+    a 429 holds back every caller for its Retry-After"""
+    max_attempts = 5
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+        try:
+            return function(*args, **kwargs)
+        except SpotifyException as ex:
+            attempt = attempt + 1
+            if ex.http_status != 429 or attempt >= max_attempts:
+                raise ex
+            retry_after = get_retry_after(ex, attempt)
+            logging.warning(
+                '(%s) Spotify rate limit reached, retrying in %s seconds',
+                str(threading.current_thread().ident), retry_after)
+            rate_limiter.pause(retry_after)
+
+
+def has_next_page(page, offset):
+    """true if a spotify page is followed by another one at offset"""
+    if len(page["items"]) == 0:
+        return False
+    if "next" in page:
+        return page["next"] is not None
+    return "total" not in page or offset < page["total"]
+
+
+def iterate_pages(function, *args, limit=constants.SPOTIFY_PAGE_LIMIT, **kwargs):
+    """Pages of a spotify list endpoint, the next page is
+    requested while the current one is processed"""
+    offset = 0
+    future = page_executor.submit(
+        call_with_retry_after, function, *args, limit=limit, offset=offset, **kwargs)
+    try:
+        while future is not None:
+            page = future.result()
+            offset = offset + limit
+            future = None
+            if has_next_page(page, offset):
+                future = page_executor.submit(
+                    call_with_retry_after, function, *args,
+                    limit=limit, offset=offset, **kwargs)
+            yield page
+    finally:
+        if future is not None:
+            future.cancel()
+
+
+def get_playlist_name_key(name):
+    """playlist name as compared with import_arg"""
+    return name.lower().strip()
+
+
+def create_playlist_listing(items) -> PlaylistListing:
+    """index user playlists by name and uri, unnamed ones are only listed"""
+    by_name = {}
+    by_uri = {}
+    for item in items:
+        by_uri[item["uri"]] = item
+        if item["name"] is not None and item["name"].strip() != '':
+            by_name.setdefault(get_playlist_name_key(item["name"]), []).append(item)
+    return PlaylistListing(items, by_name, by_uri)
+
+
+def get_user_playlist_listing() -> PlaylistListing:
+    """user playlists, listed once per import run or once per short ttl"""
+    global run_playlist_listing
+    with playlist_listing_lock:
+        listing = run_playlist_listing
+        if listing is None:
+            listing = playlist_listing_cache.get("listing")
+        if listing is None:
+            items = []
+            for playlist_result in iterate_pages(get_spotipy_client().current_user_playlists):
+                items.extend(
+                    item for item in playlist_result['items'] if item is not None)
+            listing = create_playlist_listing(items)
+            playlist_listing_cache["listing"] = listing
+            logging.info(
+                '(%s) Loaded %s playlists from your Spotify account',
+                str(threading.current_thread().ident), len(items))
+        if playlist_listing_run:
+            run_playlist_listing = listing
+    return listing
+
+
+def start_playlist_listing_run():
+    """keep the first playlist listing of an import run until it ends"""
+    global playlist_listing_run, run_playlist_listing
+    with playlist_listing_lock:
+        playlist_listing_run = True
+        run_playlist_listing = None
+
+
+def stop_playlist_listing_run():
+    """end the import run, later listings follow the ttl again"""
+    global playlist_listing_run, run_playlist_listing
+    with playlist_listing_lock:
+        playlist_listing_run = False
+        run_playlist_listing = None
+
+
 SP = create_sp_client()
@@ -1,12 +1,18 @@
 """Subsonic helper"""
 import logging
 import os
+import http.client
+import json
+import math
 import time
 import pickle
 import threading
 import libsonic
 import string
 from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+from urllib.error import HTTPError
 from expiringdict import ExpiringDict
 from libsonic.errors import DataNotFoundError
 from spotipy.exceptions import SpotifyException
@@ -14,12 +20,16 @@ from spotisub import database
 from spotisub import constants
 from spotisub import utils
 from spotisub.helpers import spotdl_helper
+from spotisub.helpers import spotipy_helper
 from spotisub.exceptions import SubsonicDataException, SubsonicOfflineException
 from spotisub.classes import ComparisonHelper, SubsonicCache
+from spotisub.classes import LibraryFingerprint, MatchMemo, SubsonicSong
 from spotisub.helpers import musicbrainz_helper
+from spotisub.library_index import LibraryIndex, write_library_index
 
 cache_executor = ThreadPoolExecutor(max_workers=1)
 spotdl_executor = ThreadPoolExecutor(max_workers=1)
+subsonic_cache_executor = ThreadPoolExecutor(max_workers=1)
 
 if os.environ.get(constants.SPOTDL_ENABLED,
                   constants.SPOTDL_ENABLED_DEFAULT_VALUE) == "1":
@@ -37,7 +47,101 @@ if os.environ.get(constants.LIDARR_ENABLED,
         "if an artist won't be found inside the " +
         "lidarr database, the download process will be skipped.")
 
-pysonic = libsonic.Connection(
+
+class SubsonicConnection:
+    """libsonic connection wrapper tracking server health from call outcomes
+
+    transport failures count towards a circuit breaker; once open, calls
+    fail fast with SubsonicOfflineException while a background thread
+    pings the server until it answers again"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.open = False
+        self.last_success = None
+        self.rate_limiter = spotipy_helper.TokenBucket(
+            constants.SUBSONIC_REQUESTS_PER_SECOND,
+            constants.SUBSONIC_REQUESTS_BURST)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.connection, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            if self.open:
+                raise SubsonicOfflineException()
+            self.rate_limiter.acquire()
+            try:
+                result = attribute(*args, **kwargs)
+            except HTTPError as e:
+                if e.code >= 500:
+                    self.record_failure()
+                    raise SubsonicOfflineException() from e
+                self.record_success()
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                self.record_failure()
+                raise SubsonicOfflineException() from e
+            self.record_success()
+            return result
+        return call
+
+    def record_success(self):
+        """record a call that reached the server"""
+        with self.lock:
+            self.failures = 0
+            self.last_success = time.monotonic()
+
+    def record_failure(self):
+        """record a transport failure, opening the circuit past the threshold"""
+        with self.lock:
+            self.failures = self.failures + 1
+            if self.open or self.failures < constants.SUBSONIC_CIRCUIT_FAILURE_THRESHOLD:
+                return
+            self.open = True
+        logging.warning(
+            '(%s) Subsonic server unreachable, pausing calls until it answers again',
+            str(threading.current_thread().ident))
+        threading.Thread(target=self.probe, daemon=True).start()
+
+    def probe(self):
+        """ping the server in background until it answers, then close the circuit"""
+        while True:
+            time.sleep(constants.SUBSONIC_CIRCUIT_PROBE_SECONDS)
+            try:
+                alive = self.connection.ping()
+            except Exception:
+                alive = False
+            if alive:
+                with self.lock:
+                    self.open = False
+                    self.failures = 0
+                    self.last_success = time.monotonic()
+                logging.info(
+                    '(%s) Subsonic server is reachable again',
+                    str(threading.current_thread().ident))
+                return
+
+    def check(self):
+        """raise SubsonicOfflineException if the server is known to be offline,
+        pinging it only when no call has succeeded recently"""
+        if self.open:
+            raise SubsonicOfflineException()
+        if (self.last_success is not None and time.monotonic() - self.last_success
+                < constants.SUBSONIC_HEALTH_MAX_AGE_SECONDS):
+            return
+        # ping() swallows transport errors and returns False
+        if self.connection.ping():
+            self.record_success()
+            return
+        self.record_failure()
+        raise SubsonicOfflineException()
+
+
+pysonic = SubsonicConnection(libsonic.Connection(
     os.environ.get(
         constants.SUBSONIC_API_HOST),
     os.environ.get(
@@ -51,62 +155,243 @@ pysonic = libsonic.Connection(
     "/rest",
     port=int(
         os.environ.get(
-            constants.SUBSONIC_API_PORT)))
-
-
-def load_subsonic_cache_from_file() -> SubsonicCache:
-    cache = SubsonicCache(0, {})
-    path = os.path.join(constants.CACHE_DIR, constants.SUBSONIC_CACHE_FILENAME)
-    if os.path.exists(path):
-        if os.stat(path).st_size == 0:
-            os.remove(path)
-        else:
-            with open(path, 'rb') as f:
-                cache = pickle.load(f)
-    return cache
-
-
-def load_spotify_cache_from_file():
-    object = ExpiringDict(max_len=10000, max_age_seconds=43200)
+            constants.SUBSONIC_API_PORT)),
+    useGET=False))
+
+
+def get_library_index_paths() -> list[str]:
+    """library index files in the cache directory, oldest first"""
+    paths = []
+    if os.path.isdir(constants.CACHE_DIR):
+        for filename in os.listdir(constants.CACHE_DIR):
+            if (filename.startswith(constants.SUBSONIC_LIBRARY_INDEX_PREFIX)
+                    and filename.endswith(constants.SUBSONIC_LIBRARY_INDEX_SUFFIX)):
+                paths.append(os.path.join(constants.CACHE_DIR, filename))
+    return sorted(paths)
+
+
+def load_subsonic_cache_from_file(path=None) -> SubsonicCache:
+    """open the newest library index, queried lazily from disk"""
+    for filename in constants.SUBSONIC_LEGACY_CACHE_FILENAMES:
+        legacy_path = os.path.join(constants.CACHE_DIR, filename)
+        if os.path.exists(legacy_path):
+            # pickled caches are rebuilt on next import
+            os.remove(legacy_path)
+    if path is None:
+        paths = get_library_index_paths()
+        if len(paths) == 0:
+            return create_subsonic_cache([], None)
+        path = paths[-1]
+    try:
+        index = LibraryIndex(path)
+        info = index.select_info()
+    except Exception:
+        utils.write_exception()
+        os.remove(path)
+        return create_subsonic_cache([], None)
+    library_fingerprint = None
+    if info.get("library_fingerprint") is not None:
+        song_count, folder_count, last_scan, folders_modified = info["library_fingerprint"]
+        library_fingerprint = LibraryFingerprint(
+            song_count, folder_count, last_scan,
+            tuple(tuple(folder) for folder in folders_modified))
+    return SubsonicCache(
+        info["total_song_count"],
+        index,
+        info["newest_album_created"],
+        library_fingerprint)
+
+
+def migrate_spotify_cache_file():
+    """move the legacy pickled spotify object cache into the database"""
     path = os.path.join(constants.CACHE_DIR, constants.SPOTIFY_OBJECT_CACHE_FILENAME)
     if os.path.exists(path):
-        if os.stat(path).st_size == 0:
-            os.remove(path)
+        try:
+            if os.stat(path).st_size > 0:
+                with open(path, 'rb') as f:
+                    old_cache_obj = pickle.load(f)
+                    database.insert_or_update_spotify_objects(
+                        {key: json.dumps(value) for key, value in old_cache_obj.items()})
+        except Exception:
+            utils.write_exception()
+        os.remove(path)
+
+
+def compact_subsonic_song(song) -> SubsonicSong:
+    """keep only the song fields used for matching and for the database"""
+    if isinstance(song, SubsonicSong):
+        return song
+    return SubsonicSong.from_dict(song)
+
+
+def create_subsonic_cache(
+        songs, newest_album_created, library_fingerprint=None) -> SubsonicCache:
+    """write every library song once to a new library index file"""
+    compact_songs = []
+    song_positions = {}
+    for song in songs:
+        if "id" not in song:
+            continue
+        song = compact_subsonic_song(song)
+        if song["id"] in song_positions:
+            compact_songs[song_positions[song["id"]]] = song
         else:
-            with open(path, 'rb') as f:
-                old_cache_obj = pickle.load(f)
-                for key, value in old_cache_obj.items():
-                    object[key] = value
-    return object
+            song_positions[song["id"]] = len(compact_songs)
+            compact_songs.append(song)
+
+    if len(compact_songs) == 0:
+        return SubsonicCache(0, None, newest_album_created, library_fingerprint)
+
+    path = os.path.join(
+        constants.CACHE_DIR,
+        constants.SUBSONIC_LIBRARY_INDEX_PREFIX
+        + str(time.time_ns())
+        + constants.SUBSONIC_LIBRARY_INDEX_SUFFIX)
+    write_library_index(path, compact_songs, {
+        "total_song_count": len(compact_songs),
+        "newest_album_created": newest_album_created,
+        "library_fingerprint": library_fingerprint})
+    return SubsonicCache(
+        len(compact_songs),
+        LibraryIndex(path),
+        newest_album_created,
+        library_fingerprint)
 
 
 # caches
 playlist_cache = ExpiringDict(max_len=500, max_age_seconds=300)
-spotify_cache = None
+spotify_cache = ExpiringDict(
+    max_len=constants.SPOTIFY_OBJECT_CACHE_MAX_LEN,
+    max_age_seconds=constants.SPOTIFY_OBJECT_CACHE_MAX_AGE_SECONDS)
 subsonic_cache = load_subsonic_cache_from_file()
+subsonic_cache_lock = threading.Lock()
+subsonic_cache_refresh = None
+library_fingerprint_lock = threading.Lock()
+library_fingerprint_checked = None
+match_memo = None
+library_index_lock = threading.Lock()
+library_index_users = {}
+retired_library_indexes = {}
+playlist_write_locks = {}
+playlist_write_locks_lock = threading.Lock()
+
+
+def remove_old_library_indexes(keep):
+    """remove library index files not open in this process, the two newest
+    may still be open in other processes"""
+    with library_index_lock:
+        keep = set(keep).union(library_index_users.keys())
+    for path in get_library_index_paths()[:-2]:
+        if path not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                utils.write_exception()
+
+
+def close_library_index(index: LibraryIndex):
+    """close a snapshot that is no longer used and remove its file"""
+    index.dispose()
+    try:
+        os.remove(index.path)
+    except OSError:
+        utils.write_exception()
+
+
+def swap_subsonic_cache(cache: SubsonicCache):
+    """make cache the current snapshot, the replaced one is closed
+    once the last import using it releases it"""
+    global subsonic_cache
+    retired = None
+    with library_index_lock:
+        current_cache = subsonic_cache
+        subsonic_cache = cache
+        if (current_cache.index is not None
+                and (cache.index is None or current_cache.index.path != cache.index.path)):
+            if library_index_users.get(current_cache.index.path, 0) == 0:
+                retired = current_cache.index
+            else:
+                retired_library_indexes[current_cache.index.path] = current_cache.index
+    if retired is not None:
+        close_library_index(retired)
+
+
+def acquire_subsonic_cache() -> SubsonicCache:
+    """current subsonic cache snapshot, kept open until release_subsonic_cache"""
+    check_and_get_subsonic_cache()
+    with library_index_lock:
+        cache = subsonic_cache
+        if cache.index is not None:
+            library_index_users[cache.index.path] = library_index_users.get(
+                cache.index.path, 0) + 1
+    return cache
+
+
+def release_subsonic_cache(cache: SubsonicCache):
+    """done with a snapshot from acquire_subsonic_cache"""
+    if cache.index is None:
+        return
+    retired = None
+    with library_index_lock:
+        path = cache.index.path
+        library_index_users[path] = library_index_users[path] - 1
+        if library_index_users[path] == 0:
+            del library_index_users[path]
+            retired = retired_library_indexes.pop(path, None)
+    if retired is not None:
+        close_library_index(retired)
+
+
+def get_cached_spotify_objects(spotify_uris) -> dict:
+    """spotify objects from the memory cache, then from the database"""
+    objects = {}
+    missing_uris = []
+    for spotify_uri in spotify_uris:
+        spotify_object = spotify_cache.get(spotify_uri)
+        if spotify_object is not None:
+            objects[spotify_uri] = spotify_object
+        else:
+            missing_uris.append(spotify_uri)
+    if len(missing_uris) > 0:
+        stored = database.select_spotify_objects(
+            missing_uris, constants.SPOTIFY_OBJECT_CACHE_MAX_AGE_SECONDS)
+        for spotify_uri, value in stored.items():
+            spotify_object = json.loads(value)
+            spotify_cache[spotify_uri] = spotify_object
+            objects[spotify_uri] = spotify_object
+    return objects
 
 
-def save_cache_object_to_file(obj, filename: str):
-    path = os.path.join(constants.CACHE_DIR, filename)
-    with open(path, 'wb') as f:
-        pickle.dump(obj, f)
+def store_spotify_objects(objects: dict):
+    """save spotify objects to the memory cache and the database"""
+    for spotify_uri, spotify_object in objects.items():
+        spotify_cache[spotify_uri] = spotify_object
+    database.insert_or_update_spotify_objects(
+        {spotify_uri: json.dumps(spotify_object)
+         for spotify_uri, spotify_object in objects.items()})
+
+
+def evict_spotify_cache():
+    """remove expired spotify objects from the database"""
+    database.delete_expired_spotify_objects(
+        constants.SPOTIFY_OBJECT_CACHE_MAX_AGE_SECONDS,
+        constants.SPOTIFY_OBJECT_CACHE_MAX_ROWS)
 
 
 def get_spotify_object_from_cache(sp, spotify_uri, force=False):
-    if not force and spotify_uri in spotify_cache:
-        return spotify_cache[spotify_uri]
-    elif force:
+    if force:
         load_spotify_object_to_cache(sp, spotify_uri)
-        return spotify_cache[spotify_uri]
-    else:
-        cache_executor.submit(load_spotify_object_to_cache, sp, spotify_uri)
+        return spotify_cache.get(spotify_uri)
+    cached = get_cached_spotify_objects([spotify_uri])
+    if spotify_uri in cached:
+        return cached[spotify_uri]
+    cache_executor.submit(load_spotify_object_to_cache, sp, spotify_uri)
     return None
 
 
 def load_spotify_object_to_cache(sp, spotify_uri):
     try:
-        global spotify_cache
-        if spotify_uri in spotify_cache:
+        if spotify_uri in get_cached_spotify_objects([spotify_uri]):
             return
         spotify_object = None
         if "track" in spotify_uri:
@@ -118,17 +403,76 @@ def load_spotify_object_to_cache(sp, spotify_uri):
         elif "playlist" in spotify_uri:
             spotify_object = sp.playlist(spotify_uri)
         if spotify_object is not None:
-            spotify_cache[spotify_uri] = spotify_object
-            save_cache_object_to_file(spotify_cache, constants.SPOTIFY_OBJECT_CACHE_FILENAME)
+            store_spotify_objects({spotify_uri: spotify_object})
     except SpotifyException:
         utils.write_exception()
         pass
 
 
-def is_subsonic_cache_stale() -> bool:
+def get_library_fingerprint(previous=None) -> LibraryFingerprint | None:
+    """scan status and per folder modification times of the subsonic library,
+    None if the server can't tell"""
+    try:
+        scan_status = check_pysonic_connection().getScanStatus()["scanStatus"]
+        known_modified = {}
+        if previous is not None:
+            known_modified = dict(previous.folders_modified)
+        folders_modified = []
+        music_folders = pysonic.getMusicFolders()["musicFolders"]
+        for folder in music_folders.get("musicFolder", []):
+            folder_id = str(folder["id"])
+            # answers without the artist list when the folder is unchanged
+            indexes = pysonic.getIndexes(
+                musicFolderId=folder["id"],
+                ifModifiedSince=known_modified.get(folder_id, 0))
+            folders_modified.append(
+                (folder_id, indexes.get("indexes", {}).get(
+                    "lastModified", known_modified.get(folder_id, 0))))
+    except SubsonicOfflineException:
+        raise
+    except Exception:
+        utils.write_exception()
+        return None
+    return LibraryFingerprint(
+        scan_status.get("count"),
+        scan_status.get("folderCount"),
+        scan_status.get("lastScan"),
+        tuple(folders_modified))
+
+
+def get_checked_library_fingerprint(previous=None) -> LibraryFingerprint | None:
+    """library fingerprint, fetched at most once per check interval for all imports"""
+    global library_fingerprint_checked
+    interval = int(os.environ.get(
+        constants.SUBSONIC_CACHE_CHECK_SECONDS,
+        constants.SUBSONIC_CACHE_CHECK_SECONDS_DEFAULT_VALUE))
+    with library_fingerprint_lock:
+        if (library_fingerprint_checked is not None
+                and time.monotonic() - library_fingerprint_checked[0] < interval):
+            return library_fingerprint_checked[1]
+        fingerprint = get_library_fingerprint(previous)
+        library_fingerprint_checked = (time.monotonic(), fingerprint)
+        return fingerprint
+
+
+def is_subsonic_library_changed(cache: SubsonicCache) -> bool:
+    """compare the library fingerprint with the one the cache was built from"""
+    if cache.library_fingerprint is None:
+        return is_subsonic_cache_stale(cache)
+    try:
+        fingerprint = get_checked_library_fingerprint(cache.library_fingerprint)
+    except SubsonicOfflineException:
+        utils.write_exception()
+        return False
+    if fingerprint is None:
+        return is_subsonic_cache_stale(cache)
+    return fingerprint != cache.library_fingerprint
+
+
+def is_subsonic_cache_stale(cache: SubsonicCache) -> bool:
     try:
         # fetch what should be the last song in the subsonic library, according to the cache
-        subsonic_search = check_pysonic_connection().search2("", songCount=2, songOffset=subsonic_cache.total_song_count - 1, artistCount=0, albumCount=0)
+        subsonic_search = check_pysonic_connection().search2("", songCount=2, songOffset=cache.total_song_count - 1, artistCount=0, albumCount=0)
         if "searchResult2" not in subsonic_search:
             raise SubsonicDataException(f'({threading.current_thread().ident}) search2 failed for checking subsonic cache.')
 
@@ -145,63 +489,270 @@ def is_subsonic_cache_stale() -> bool:
     return False
 
 
-def build_subsonic_cache() -> SubsonicCache:
-    SONG_COUNT = 500
-    song_offset = 0
-    total_song_count = 0
-    subsonic_songs_dict = {}
-    try:
-        while True:
-            logging.debug(f'Fetching {SONG_COUNT} songs from subsonic library...')
-            subsonic_search = check_pysonic_connection().search2("", songCount=SONG_COUNT, songOffset=song_offset, artistCount=0, albumCount=0)
-            if "searchResult2" not in subsonic_search: # this should probably be an exception
-                break
+def get_newest_albums(since: str | None, limit=None) -> list:
+    """albums created after since, newest first"""
+    ALBUM_COUNT = 500
+    offset = 0
+    albums = []
+    while True:
+        album_search = check_pysonic_connection().getAlbumList2(
+            "newest", size=ALBUM_COUNT if limit is None else limit, offset=offset)
+        if ("albumList2" not in album_search
+                or "album" not in album_search["albumList2"]):
+            break
+        page = album_search["albumList2"]["album"]
+        for album in page:
+            if since is not None and album.get("created", "") <= since:
+                return albums
+            albums.append(album)
+        if limit is not None or len(page) < ALBUM_COUNT:
+            break
+        offset += len(page)
+    return albums
+
+
+def get_newest_album_created() -> str | None:
+    """creation date of the newest album in the subsonic library"""
+    albums = get_newest_albums(None, limit=1)
+    if len(albums) > 0 and "created" in albums[0]:
+        return albums[0]["created"]
+    return None
 
-            if "song" not in subsonic_search["searchResult2"]:
-                # done searching
-                break
 
-            num_retrieved_songs = len(subsonic_search["searchResult2"]["song"]);
+def is_synced_cache_consistent(cache: SubsonicCache, synced_cache: SubsonicCache) -> bool:
+    """false if the sync missed new songs in old albums or deleted songs"""
+    # they leave the count out of sync, with the server song count too
+    # when deletions and additions even out
+    library_fingerprint = synced_cache.library_fingerprint
+    return not (is_subsonic_cache_stale(synced_cache)
+                or (library_fingerprint is not None
+                    and cache.library_fingerprint is not None
+                    and library_fingerprint.song_count is not None
+                    and cache.library_fingerprint.song_count is not None
+                    and library_fingerprint.song_count - cache.library_fingerprint.song_count
+                    != synced_cache.total_song_count - cache.total_song_count))
+
+
+def sync_subsonic_cache(cache: SubsonicCache) -> SubsonicCache | None:
+    """merge songs of albums created since the last sync, None if a full rebuild is needed"""
+    if cache.index is None or cache.newest_album_created is None:
+        return None
+    try:
+        scan_status = check_pysonic_connection().getScanStatus()
+        if "scanStatus" in scan_status and scan_status["scanStatus"].get("scanning"):
+            logging.info(
+                '(%s) Subsonic library scan in progress, keeping the current cache',
+                str(threading.current_thread().ident))
+            return cache
+
+        library_fingerprint = get_library_fingerprint(cache.library_fingerprint)
+        new_songs = []
+        newest_album_created = cache.newest_album_created
+        albums = get_newest_albums(cache.newest_album_created)
+        for album in albums:
+            album_search = check_pysonic_connection().getAlbum(album["id"])
+            if "album" in album_search and "song" in album_search["album"]:
+                new_songs.extend(album_search["album"]["song"])
+            newest_album_created = max(newest_album_created, album["created"])
+        songs = []
+        if len(new_songs) > 0:
+            songs = cache.index.select_all_songs() + new_songs
+    except Exception:
+        utils.write_exception()
+        return None
+
+    if len(new_songs) == 0:
+        # a scan that found nothing new still moves the fingerprint, keep the
+        # snapshot so the library version of stored matches stays valid
+        unchanged_cache = cache._replace(
+            newest_album_created=newest_album_created,
+            library_fingerprint=library_fingerprint)
+        if not is_synced_cache_consistent(cache, unchanged_cache):
+            logging.info(
+                '(%s) Subsonic cache consistency check failed after sync',
+                str(threading.current_thread().ident))
+            return None
+        logging.info(
+            '(%s) No new songs in the subsonic library, keeping the current cache',
+            str(threading.current_thread().ident))
+        return unchanged_cache
 
-            if num_retrieved_songs == 0:
-                # done searching, though this shouldn't get here
+    synced_cache = create_subsonic_cache(
+        songs, newest_album_created, library_fingerprint)
+
+    if not is_synced_cache_consistent(cache, synced_cache):
+        logging.info(
+            '(%s) Subsonic cache consistency check failed after sync',
+            str(threading.current_thread().ident))
+        # the merged snapshot is never used, don't leave it to be adopted
+        if synced_cache.index is not None:
+            close_library_index(synced_cache.index)
+        return None
+
+    logging.info(
+        '(%s) Synced %s new albums and %s songs into the subsonic cache',
+        str(threading.current_thread().ident), len(albums),
+        synced_cache.total_song_count - cache.total_song_count)
+
+    return synced_cache
+
+
+def fetch_subsonic_songs_page(offset, size):
+    """fetch a page of songs from the whole subsonic library"""
+    start = time.monotonic()
+    subsonic_search = pysonic.search2(
+        "", songCount=size, songOffset=offset, artistCount=0, albumCount=0)
+    if "searchResult2" not in subsonic_search:
+        raise SubsonicDataException(
+            f'({threading.current_thread().ident}) search2 failed for building subsonic cache.')
+    songs = []
+    if "song" in subsonic_search["searchResult2"]:
+        songs = subsonic_search["searchResult2"]["song"]
+    return songs, time.monotonic() - start
+
+
+def crawl_subsonic_library() -> list:
+    """fetch every song of the subsonic library with concurrent search2 pages"""
+    # check once, pages are then fetched without a ping each
+    check_pysonic_connection()
+    MIN_SONG_COUNT = 100
+    MAX_SONG_COUNT = 2000
+    TARGET_PAGE_SECONDS = 2
+    workers = int(os.environ.get(
+        constants.SUBSONIC_CACHE_WORKERS,
+        constants.SUBSONIC_CACHE_WORKERS_DEFAULT_VALUE))
+    song_count = 500
+    next_offset = 0
+    # first offset known to be past the end of the library
+    end_offset = None
+    pages = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        while True:
+            while len(in_flight) < workers and (
+                    end_offset is None or next_offset < end_offset):
+                future = executor.submit(
+                    fetch_subsonic_songs_page, next_offset, song_count)
+                in_flight[future] = (next_offset, song_count)
+                next_offset += song_count
+            if len(in_flight) == 0:
                 break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                offset, size = in_flight.pop(future)
+                songs, elapsed = future.result()
+                if len(songs) == 0:
+                    if end_offset is None or offset < end_offset:
+                        end_offset = offset
+                    continue
+                pages[offset] = songs
+                if len(songs) < size:
+                    # either the end of the library or a server side page
+                    # limit: fetch the rest of the page to find out
+                    future = executor.submit(
+                        fetch_subsonic_songs_page,
+                        offset + len(songs),
+                        size - len(songs))
+                    in_flight[future] = (offset + len(songs), size - len(songs))
+                elif elapsed < TARGET_PAGE_SECONDS / 2:
+                    song_count = min(song_count * 2, MAX_SONG_COUNT)
+                if elapsed > TARGET_PAGE_SECONDS:
+                    song_count = max(song_count // 2, MIN_SONG_COUNT)
+            logging.debug(
+                '(%s) Fetched %s songs from subsonic library...',
+                str(threading.current_thread().ident),
+                sum(len(page) for page in pages.values()))
 
-            song_offset += num_retrieved_songs
+    songs = []
+    for offset in sorted(pages):
+        songs.extend(pages[offset])
+    return songs
 
-            if num_retrieved_songs < SONG_COUNT:
-                total_song_count = song_offset
 
-            for song in subsonic_search["searchResult2"]["song"]:
-                if "musicBrainzId" in song:
-                    subsonic_songs_dict[song["musicBrainzId"]] = song 
+def build_subsonic_cache() -> SubsonicCache:
+    try:
+        # read before crawling, so albums added meanwhile are synced later
+        newest_album_created = get_newest_album_created()
+        library_fingerprint = get_library_fingerprint()
+        songs = crawl_subsonic_library()
     except Exception:
         utils.write_exception()
-        return SubsonicCache(0, {})
+        return create_subsonic_cache([], None)
+
+    cache = create_subsonic_cache(songs, newest_album_created, library_fingerprint)
 
-    cache = SubsonicCache(total_song_count, subsonic_songs_dict)
+    logging.debug(f'Found {cache.total_song_count} songs in subsonic library.')
 
-    logging.debug(f'Found {cache.total_song_count} songs and {len(subsonic_songs_dict)} MBIDs in subsonic library.')
+    return cache
 
-    save_cache_object_to_file(cache, constants.SUBSONIC_CACHE_FILENAME)
 
+def refresh_subsonic_cache(rebuild=False) -> SubsonicCache:
+    """sync or rebuild the subsonic cache, then swap the new snapshot in"""
+    current_cache = subsonic_cache
+    cache = None
+    if not rebuild:
+        paths = get_library_index_paths()
+        if (len(paths) > 0 and (current_cache.index is None
+                                or paths[-1] > current_cache.index.path)):
+            # another process already wrote a newer snapshot
+            cache = load_subsonic_cache_from_file(paths[-1])
+            if cache.index is not None and not is_subsonic_library_changed(cache):
+                swap_subsonic_cache(cache)
+                return cache
+            if cache.index is not None:
+                cache.index.dispose()
+            cache = None
+        if not is_subsonic_library_changed(current_cache):
+            return current_cache
+        logging.info(f'({threading.current_thread().ident}) subsonic cache is stale, syncing...')
+        cache = sync_subsonic_cache(current_cache)
+    if cache is None:
+        logging.info(f'({threading.current_thread().ident}) rebuilding subsonic cache...')
+        cache = build_subsonic_cache()
+    if cache.total_song_count == 0 and current_cache.total_song_count > 0:
+        logging.warning(
+            '(%s) Subsonic cache rebuild returned no songs, keeping the current cache',
+            str(threading.current_thread().ident))
+        return current_cache
+    # imports holding the old snapshot keep using it until they release it
+    swap_subsonic_cache(cache)
+    remove_old_library_indexes(
+        [snapshot.index.path for snapshot in (current_cache, cache)
+         if snapshot.index is not None])
     return cache
 
 
-def check_and_get_subsonic_cache():
-    if not is_subsonic_cache_stale():
-        return subsonic_cache
+def request_subsonic_cache_refresh(rebuild=False):
+    """refresh the subsonic cache in background, once at a time"""
+    global subsonic_cache_refresh
+    with subsonic_cache_lock:
+        if (rebuild or subsonic_cache_refresh is None
+                or subsonic_cache_refresh.done()):
+            subsonic_cache_refresh = subsonic_cache_executor.submit(
+                refresh_subsonic_cache, rebuild)
+        return subsonic_cache_refresh
+
+
+def check_and_get_subsonic_cache() -> SubsonicCache:
+    """current subsonic cache snapshot, refreshed in background when stale"""
+    cache = subsonic_cache
+    if cache.total_song_count == 0:
+        # nothing to match against yet, wait for the first crawl
+        return request_subsonic_cache_refresh().result()
+    if is_subsonic_library_changed(cache):
+        request_subsonic_cache_refresh()
+    return cache
 
-    logging.info(f'({threading.current_thread().ident}) subsonic cache is stale, rebuilding...')
 
-    return build_subsonic_cache()
+def rebuild_subsonic_cache():
+    """full rebuild of the subsonic cache, on explicit request"""
+    request_subsonic_cache_refresh(rebuild=True)
 
 
 def check_pysonic_connection():
     """Return SubsonicOfflineException if pysonic is offline"""
-    if pysonic.ping():
-        return pysonic
-    raise SubsonicOfflineException()
+    pysonic.check()
+    return pysonic
 
 
 def get_artists_array_names():
@@ -273,15 +824,70 @@ def has_isrc(track):
     return True
 
 
-def add_missing_values_to_track(sp, track):
-    """calls spotify if tracks has missing album or isrc or uri"""
-    if "id" in track:
+def hydrate_tracks(sp, tracks, failed_uris=None):
+    """loads missing album and isrc values with batched spotify calls,
+    tracks are read and yielded one batch at a time"""
+    batch = []
+    for track in tracks:
+        batch.append(track)
+        if len(batch) == constants.SPOTIFY_TRACKS_BATCH_SIZE:
+            yield from hydrate_track_batch(sp, batch, failed_uris)
+            batch = []
+    if len(batch) > 0:
+        yield from hydrate_track_batch(sp, batch, failed_uris)
+
+
+def hydrate_track_batch(sp, tracks, failed_uris=None):
+    """loads missing album and isrc values of a batch of tracks,
+    uris that could not be loaded are added to failed_uris"""
+    missing_uris = []
+    for track in tracks:
+        if (track is not None and "id" in track and track["id"] is not None
+                and ("album" not in track or not has_isrc(track))):
+            uri = 'spotify:track:' + track['id']
+            if uri not in missing_uris:
+                missing_uris.append(uri)
+
+    spotify_tracks = get_cached_spotify_objects(missing_uris)
+    missing_uris = [uri for uri in missing_uris if uri not in spotify_tracks]
+
+    loaded = 0
+    for i in range(0, len(missing_uris), constants.SPOTIFY_TRACKS_BATCH_SIZE):
+        try:
+            response = spotipy_helper.call_with_retry_after(
+                sp.tracks, missing_uris[i:i + constants.SPOTIFY_TRACKS_BATCH_SIZE])
+        except SpotifyException:
+            utils.write_exception()
+            if failed_uris is not None:
+                failed_uris.extend(
+                    missing_uris[i:i + constants.SPOTIFY_TRACKS_BATCH_SIZE])
+            continue
+        loaded_tracks = {}
+        for spotify_track in response["tracks"]:
+            if spotify_track is not None and "uri" in spotify_track:
+                loaded_tracks[spotify_track["uri"]] = spotify_track
+        store_spotify_objects(loaded_tracks)
+        spotify_tracks.update(loaded_tracks)
+        loaded = loaded + len(loaded_tracks)
+
+    logging.debug(
+        '(%s) Loaded %s of %s missing tracks from spotify in %s requests',
+        str(threading.current_thread().ident),
+        loaded,
+        len(missing_uris),
+        math.ceil(len(missing_uris) / constants.SPOTIFY_TRACKS_BATCH_SIZE))
+
+    return [add_missing_values_to_track(track, spotify_tracks)
+            for track in tracks]
+
+
+def add_missing_values_to_track(track, spotify_tracks):
+    """uses the hydrated spotify tracks if track has missing album or isrc or uri"""
+    if track is not None and "id" in track and track["id"] is not None:
         uri = 'spotify:track:' + track['id']
         if "album" not in track or not has_isrc(track):
-            spotify_track = get_spotify_object_from_cache(sp, uri, force=True)
-            if spotify_track is not None:
-                track = spotify_track
-            time.sleep(0.25)
+            if uri in spotify_tracks:
+                track = spotify_tracks[uri]
         if "uri" not in track:
             track["uri"] = uri
         return track
@@ -295,8 +901,25 @@ def generate_playlist(playlist_info):
     return database.create_playlist(playlist_info)
 
 
+def get_playlist_write_lock(playlist_name) -> threading.Lock:
+    """lock held by the one import writing a subsonic playlist"""
+    with playlist_write_locks_lock:
+        if playlist_name not in playlist_write_locks:
+            playlist_write_locks[playlist_name] = threading.Lock()
+        return playlist_write_locks[playlist_name]
+
+
 def write_playlist(sp, playlist_info, results):
-    """write playlist to subsonic db"""
+    """write playlist to subsonic db, one import at a time per subsonic playlist"""
+    playlist_name = os.environ.get(
+        constants.PLAYLIST_PREFIX,
+        constants.PLAYLIST_PREFIX_DEFAULT_VALUE).replace("\"", "") + playlist_info["name"]
+    with get_playlist_write_lock(playlist_name.strip()):
+        write_playlist_tracks(sp, playlist_info, results)
+
+
+def write_playlist_tracks(sp, playlist_info, results):
+    """write playlist tracks to subsonic db"""
     try:
         playlist_info["prefix"] = os.environ.get(
             constants.PLAYLIST_PREFIX,
@@ -305,6 +928,7 @@ def write_playlist(sp, playlist_info, results):
             playlist_info["prefix"].replace("\"", "") + playlist_info["name"])
         song_ids = []
         old_song_ids = []
+        current_song_ids = []
         if playlist_id is None:
             check_pysonic_connection().createPlaylist(
                 name=playlist_info["prefix"].replace("\"", "") + playlist_info["name"], songIds=[])
@@ -315,7 +939,8 @@ def write_playlist(sp, playlist_info, results):
                 playlist_info["prefix"].replace("\"", "") + playlist_info["name"])
             database.delete_playlist_relation_by_id(playlist_id)
         else:
-            old_song_ids = get_playlist_songs_ids_by_id(playlist_id)
+            old_song_ids, current_song_ids = get_playlist_songs_ids_by_id(
+                playlist_id)
 
         if playlist_id is not None:
             pl_info_db = database.select_playlist_info_by_uuid(
@@ -327,91 +952,115 @@ def write_playlist(sp, playlist_info, results):
             else:
                 playlist_info["subsonic_playlist_id"] = playlist_id
                 track_helper = []
-                subsonic_cache = check_and_get_subsonic_cache()
-                for track in results['tracks']:
-                    track = add_missing_values_to_track(sp, track)
-
-                    if track is None:
-                        logging.error(f'({threading.current_thread().ident}) track was set to None when adding missing values, skipping.')
-                        continue
-
-                    found = False
-                    excluded = False
-                    logging.info(
-                        '(%s) Searching %s in your music library',
-                        str(threading.current_thread().ident),
-                        track['name'])
-                    comparison_helper = ComparisonHelper(
-                        track, track["artists"][0], found, excluded, song_ids, track_helper)
-                    comparison_helper = match_with_subsonic_track(
-                        comparison_helper,
-                        playlist_info,
-                        old_song_ids,
-                        subsonic_cache.song_mbid_dict)
-
-                    track = comparison_helper.track
-                    artist_spotify = comparison_helper.artist_spotify
-                    found = comparison_helper.found
-                    excluded = comparison_helper.excluded
-                    song_ids = comparison_helper.song_ids
-                    track_helper = comparison_helper.track_helper
-                    if not excluded:
-                        if (os.environ.get(constants.SPOTDL_ENABLED,
-                                           constants.SPOTDL_ENABLED_DEFAULT_VALUE) == "1"
-                                and found is False):
-                            if "external_urls" in track and track["external_urls"] is not None and "spotify" in track[
-                                    "external_urls"] and track["external_urls"]["spotify"] is not None:
-                                is_monitored = True
-                                if (os.environ.get(constants.LIDARR_ENABLED,
-                                                   constants.LIDARR_ENABLED_DEFAULT_VALUE) == "1"):
-                                    is_monitored = lidarr_helper.is_artist_monitored(
-                                        artist_spotify["name"])
-                                if is_monitored:
-                                    logging.warning(
-                                        '(%s) Track %s - %s not found in your music ' +
-                                        'library, using SPOTDL downloader',
-                                        str(threading.current_thread().ident),
-                                        artist_spotify["name"],
-                                        track['name'])
-                                    logging.warning(
-                                        '(%s) This track will be available after ' +
-                                        'navidrome rescans your music dir',
-                                        str(threading.current_thread().ident))
-                                    spotdl_executor.submit(
-                                        spotdl_helper.download_track, track["external_urls"]["spotify"])
-                                else:
-                                    logging.warning(
-                                        '(%s) Track %s - %s not found in your music library',
-                                        str(threading.current_thread().ident),
-                                        artist_spotify["name"],
-                                        track['name'])
-                                    logging.warning(
-                                        '(%s) This track hasn'
-                                        't been found in your Lidarr database, ' +
-                                        'skipping download process',
-                                        str(threading.current_thread().ident))
-                        elif found is False:
-                            logging.warning(
-                                '(%s) Track %s - %s not found in your music library',
-                                str(threading.current_thread().ident),
-                                artist_spotify["name"],
-                                track['name'])
-                            insert_result = database.insert_song(
-                                playlist_info, None, artist_spotify, track)
-
-                if len(song_ids) > 0:
-                    check_pysonic_connection().createPlaylist(
-                        playlistId=playlist_info["subsonic_playlist_id"], songIds=song_ids)
-                    logging.info('(%s) Success! Created playlist %s', str(
-                        threading.current_thread().ident), playlist_info["name"])
-                elif len(song_ids) == 0:
-                    try:
-                        check_pysonic_connection().deletePlaylist(
-                            playlist_info["subsonic_playlist_id"])
-                        logging.info('(%s) Fail! No songs found for playlist %s', str(
+                # tracks missed because a lookup failed are retried next run
+                lookup_failed = False
+                failed_uris = []
+                # the snapshot stays open until this import is done with it
+                subsonic_cache = acquire_subsonic_cache()
+                try:
+                    # fetching and hydration run ahead while tracks are matched
+                    tracks = utils.iterate_in_background(
+                        hydrate_tracks(sp, results['tracks'], failed_uris),
+                        constants.IMPORT_PIPELINE_BUFFER_SIZE)
+                    for track in tracks:
+                        if track is None:
+                            logging.error(f'({threading.current_thread().ident}) track was set to None when adding missing values, skipping.')
+                            continue
+
+                        found = False
+                        excluded = False
+                        logging.info(
+                            '(%s) Searching %s in your music library',
+                            str(threading.current_thread().ident),
+                            track['name'])
+                        comparison_helper = ComparisonHelper(
+                            track, track["artists"][0], found, excluded, song_ids, track_helper)
+                        comparison_helper = match_with_subsonic_track(
+                            comparison_helper,
+                            playlist_info,
+                            old_song_ids,
+                            subsonic_cache)
+                        if comparison_helper.lookup_failed:
+                            lookup_failed = True
+
+                        track = comparison_helper.track
+                        artist_spotify = comparison_helper.artist_spotify
+                        found = comparison_helper.found
+                        excluded = comparison_helper.excluded
+                        song_ids = comparison_helper.song_ids
+                        track_helper = comparison_helper.track_helper
+                        if not excluded:
+                            if (os.environ.get(constants.SPOTDL_ENABLED,
+                                               constants.SPOTDL_ENABLED_DEFAULT_VALUE) == "1"
+                                    and found is False):
+                                if "external_urls" in track and track["external_urls"] is not None and "spotify" in track[
+                                        "external_urls"] and track["external_urls"]["spotify"] is not None:
+                                    is_monitored = True
+                                    if (os.environ.get(constants.LIDARR_ENABLED,
+                                                       constants.LIDARR_ENABLED_DEFAULT_VALUE) == "1"):
+                                        is_monitored = lidarr_helper.is_artist_monitored(
+                                            artist_spotify["name"])
+                                    if is_monitored:
+                                        logging.warning(
+                                            '(%s) Track %s - %s not found in your music ' +
+                                            'library, using SPOTDL downloader',
+                                            str(threading.current_thread().ident),
+                                            artist_spotify["name"],
+                                            track['name'])
+                                        logging.warning(
+                                            '(%s) This track will be available after ' +
+                                            'navidrome rescans your music dir',
+                                            str(threading.current_thread().ident))
+                                        spotdl_executor.submit(
+                                            spotdl_helper.download_track, track["external_urls"]["spotify"])
+                                    else:
+                                        logging.warning(
+                                            '(%s) Track %s - %s not found in your music library',
+                                            str(threading.current_thread().ident),
+                                            artist_spotify["name"],
+                                            track['name'])
+                                        logging.warning(
+                                            '(%s) This track hasn'
+                                            't been found in your Lidarr database, ' +
+                                            'skipping download process',
+                                            str(threading.current_thread().ident))
+                            elif found is False:
+                                logging.warning(
+                                    '(%s) Track %s - %s not found in your music library',
+                                    str(threading.current_thread().ident),
+                                    artist_spotify["name"],
+                                    track['name'])
+                                insert_result = database.insert_song(
+                                    playlist_info, None, artist_spotify, track)
+
+                    if len(song_ids) > 0:
+                        update_playlist_songs(
+                            playlist_info["subsonic_playlist_id"], current_song_ids, song_ids)
+                        logging.info('(%s) Success! Created playlist %s', str(
                             threading.current_thread().ident), playlist_info["name"])
-                    except DataNotFoundError:
-                        pass
+                    elif len(song_ids) == 0:
+                        try:
+                            check_pysonic_connection().deletePlaylist(
+                                playlist_info["subsonic_playlist_id"])
+                            logging.info('(%s) Fail! No songs found for playlist %s', str(
+                                threading.current_thread().ident), playlist_info["name"])
+                        except DataNotFoundError:
+                            pass
+
+                    if lookup_failed or len(failed_uris) > 0:
+                        logging.warning(
+                            '(%s) Some tracks of playlist %s could not be looked up, ' +
+                            'it will be imported again on the next run',
+                            str(threading.current_thread().ident),
+                            playlist_info["name"])
+                        database.reset_playlist_sync_state(playlist_info["uuid"])
+                    elif "spotify_snapshot_id" in playlist_info:
+                        database.update_playlist_info_sync_state(
+                            playlist_info["uuid"],
+                            playlist_info["spotify_snapshot_id"],
+                            get_library_version(subsonic_cache))
+                finally:
+                    release_subsonic_cache(subsonic_cache)
 
     except SubsonicOfflineException:
         logging.error(
@@ -419,14 +1068,58 @@ def write_playlist(sp, playlist_info, results):
             str(threading.current_thread().ident))
 
 
-def get_subsonic_track_via_mbid(comparison_helper, subsonic_tracks_dict: dict[str, dict]) -> dict | None:
+def update_playlist_songs(playlist_id, current_song_ids, song_ids):
+    """turn the subsonic playlist entries into song_ids with minimal updatePlaylist calls"""
+    CHUNK_SIZE = 250
+    kept = 0
+    indexes_to_remove = []
+    # updatePlaylist can only append, so keep the longest prefix of
+    # song_ids that is still in order inside the current playlist
+    for index, song_id in enumerate(current_song_ids):
+        if kept < len(song_ids) and song_id == song_ids[kept]:
+            kept = kept + 1
+        else:
+            indexes_to_remove.append(index)
+    song_ids_to_add = song_ids[kept:]
+
+    # removing from the end first keeps the remaining indexes valid between chunks
+    indexes_to_remove.reverse()
+    remove_chunks = [indexes_to_remove[i:i + CHUNK_SIZE]
+                     for i in range(0, len(indexes_to_remove), CHUNK_SIZE)] or [[]]
+    add_chunks = [song_ids_to_add[i:i + CHUNK_SIZE]
+                  for i in range(0, len(song_ids_to_add), CHUNK_SIZE)] or [[]]
+    requests = [(chunk, []) for chunk in remove_chunks[:-1]]
+    requests.append((remove_chunks[-1], add_chunks[0]))
+    requests.extend([([], chunk) for chunk in add_chunks[1:]])
+
+    for remove_chunk, add_chunk in requests:
+        if len(remove_chunk) > 0 or len(add_chunk) > 0:
+            check_pysonic_connection().updatePlaylist(
+                playlist_id,
+                songIdsToAdd=add_chunk,
+                songIndexesToRemove=remove_chunk)
+
+    logging.info(
+        '(%s) Playlist with id "%s" updated: %s songs kept, %s removed, %s added',
+        str(threading.current_thread().ident),
+        playlist_id,
+        kept,
+        len(indexes_to_remove),
+        len(song_ids_to_add))
+
+
+def get_subsonic_track_via_mbid(comparison_helper, cache: SubsonicCache) -> dict | None:
     isrc = comparison_helper.track["external_ids"]["isrc"]
     spotify_track_mbids = musicbrainz_helper.get_mbids_from_isrc(isrc)
+    if spotify_track_mbids is None:
+        comparison_helper.lookup_failed = True
+        spotify_track_mbids = []
     matched_track = None
-    for mbid in spotify_track_mbids:
-        if mbid in subsonic_tracks_dict:
-            matched_track = subsonic_tracks_dict[mbid]
-            break
+    if cache.index is not None:
+        for mbid in spotify_track_mbids:
+            matched_track = cache.index.select_song_by_mbid(mbid)
+            if matched_track is not None:
+                break
 
     if matched_track is None:
         logging.debug(f'({threading.current_thread().ident}) Spotify track with mbids {spotify_track_mbids} was not found in library.')
@@ -434,8 +1127,26 @@ def get_subsonic_track_via_mbid(comparison_helper, subsonic_tracks_dict: dict[st
     return matched_track
 
 
-def get_subsonic_track_via_string_compare(comparison_helper, subsonic_tracks_dict: dict[str, dict]) -> dict | None:
-    matched_tracks = [s_t for s_t in subsonic_tracks_dict.values() if utils.compare_track_metadata(comparison_helper, s_t)]
+def get_text_compare_candidates(comparison_helper, cache: SubsonicCache) -> list[dict]:
+    """library songs whose artist can match the spotify artist, in library order"""
+    if cache.index is None:
+        return []
+
+    artist_variants = comparison_helper.artist_variants
+    if any(len(variant) < 3 for variant in artist_variants):
+        candidate_artists = cache.index.select_all_artists()
+    else:
+        candidate_artists = cache.index.select_artists_by_trigrams(
+            utils.generate_trigrams(artist_variants))
+
+    artists = [artist for artist, variants in candidate_artists.items()
+               if utils.compare(artist_variants, variants)]
+
+    return cache.index.select_songs_by_artists(artists)
+
+
+def get_subsonic_track_via_string_compare(comparison_helper, cache: SubsonicCache) -> dict | None:
+    matched_tracks = [s_t for s_t in get_text_compare_candidates(comparison_helper, cache) if utils.compare_track_metadata(comparison_helper, s_t)]
     
     if len(matched_tracks) == 0:
         logging.debug(f'({threading.current_thread().ident}) Spotify track {comparison_helper.track["name"]} - {comparison_helper.artist_spotify["name"]} was not found in library via string compare.')
@@ -445,25 +1156,143 @@ def get_subsonic_track_via_string_compare(comparison_helper, subsonic_tracks_dic
     # for now just pick the first one
     matched_track = matched_tracks[0]
 
-    if (utils.compare_string_to_exclusion(matched_track["title"],
-        utils.get_excluded_words_array())
-        or utils.compare_string_to_exclusion(matched_track["album"],
-                                             utils.get_excluded_words_array())):
+    if is_excluded_track(matched_track):
         comparison_helper.excluded = True
         # NOTE: do we need to handle removing the excluded song if it was previously in the playlist but is now excluded?
 
     return matched_track
 
-def match_with_subsonic_track(
-        comparison_helper: ComparisonHelper, playlist_info, old_song_ids, subsonic_tracks_dict) -> ComparisonHelper:
-    """compare spotify track to subsonic one"""
+
+def is_excluded_track(subsonic_track) -> bool:
+    """true if the song title or album contains an excluded word"""
+    return (utils.compare_string_to_exclusion(subsonic_track["title"],
+            utils.get_excluded_words_array())
+            or utils.compare_string_to_exclusion(subsonic_track["album"],
+                                                 utils.get_excluded_words_array()))
+
+
+def get_library_version(cache: SubsonicCache) -> str | None:
+    """library snapshot and matching settings a stored match was made with"""
+    if cache.index is None:
+        return None
+    version = os.path.basename(cache.index.path)
+    if os.environ.get(constants.TEXT_COMAPRE_MATCHING_ENABLED, constants.TEXT_COMAPRE_MATCHING_ENABLED_DEFAULT_VALUE) == "1":
+        version = version + ":text"
+    return version
+
+
+def is_playlist_unchanged(playlist_info_db, spotify_uri, spotify_snapshot_id) -> bool:
+    """true if neither the spotify playlist nor the library changed since its last import"""
+    if (spotify_snapshot_id is None
+            or playlist_info_db.subsonic_playlist_id is None
+            or playlist_info_db.spotify_playlist_uri != spotify_uri
+            or playlist_info_db.spotify_snapshot_id != spotify_snapshot_id
+            or playlist_info_db.library_version is None):
+        return False
+    cache = check_and_get_subsonic_cache()
+    refresh = subsonic_cache_refresh
+    # the snapshot in use is older than the library until the refresh swaps it
+    if ((refresh is not None and not refresh.done())
+            or is_subsonic_library_changed(cache)):
+        return False
+    if playlist_info_db.library_version != get_library_version(cache):
+        return False
+    # a playlist deleted from subsonic by hand has to be written again
+    try:
+        check_pysonic_connection().getPlaylist(playlist_info_db.subsonic_playlist_id)
+    except DataNotFoundError:
+        return False
+    return True
+
+
+def get_stored_subsonic_track(comparison_helper: ComparisonHelper, cache: SubsonicCache, library_version):
+    """(True, song) if a stored match can be trusted, song is None for a known miss"""
+    stored = database.select_spotify_subsonic_match(comparison_helper.track["uri"])
+    if stored is None:
+        return False, None
+    if stored.subsonic_song_id is None:
+        # a song added to the library since may match now
+        return stored.library_version == library_version, None
+    if (stored.match_method != constants.MATCH_METHOD_MBID
+            and stored.library_version != library_version):
+        return False, None
+    matched_track = cache.index.select_song_by_id(stored.subsonic_song_id)
+    if matched_track is None:
+        return False, None
+    if stored.match_method == constants.MATCH_METHOD_TEXT and is_excluded_track(matched_track):
+        comparison_helper.excluded = True
+    return True, matched_track
+
+
+def start_match_memo():
+    """share track matches between the playlists of an import run"""
+    global match_memo
+    match_memo = MatchMemo()
+
+
+def stop_match_memo() -> MatchMemo | None:
+    """end the import run, the memo is returned for its statistics"""
+    global match_memo
+    memo = match_memo
+    match_memo = None
+    return memo
+
+
+def find_subsonic_track(comparison_helper: ComparisonHelper, cache: SubsonicCache):
+    """library song matching the spotify track, from a previous run when it
+    can be trusted, else via ISRC then string comparison"""
+    spotify_uri = comparison_helper.track.get("uri")
+    library_version = get_library_version(cache)
+    if spotify_uri is not None and library_version is not None:
+        trusted, matched_track = get_stored_subsonic_track(
+            comparison_helper, cache, library_version)
+        if trusted:
+            return matched_track
+
     matched_track = None
+    match_method = constants.MATCH_METHOD_NONE
     if has_isrc(comparison_helper.track):
-        matched_track = get_subsonic_track_via_mbid(comparison_helper, subsonic_tracks_dict)
+        matched_track = get_subsonic_track_via_mbid(comparison_helper, cache)
+        if matched_track is not None:
+            match_method = constants.MATCH_METHOD_MBID
 
     if matched_track is None and os.environ.get(constants.TEXT_COMAPRE_MATCHING_ENABLED, constants.TEXT_COMAPRE_MATCHING_ENABLED_DEFAULT_VALUE) == "1":
         logging.info(f'({threading.current_thread().ident}) Spotify track {comparison_helper.track["name"]} - {comparison_helper.artist_spotify["name"]} not found via ISRC; searching via string comparison...')
-        matched_track = get_subsonic_track_via_string_compare(comparison_helper, subsonic_tracks_dict)
+        matched_track = get_subsonic_track_via_string_compare(comparison_helper, cache)
+        if matched_track is not None:
+            match_method = constants.MATCH_METHOD_TEXT
+
+    if (spotify_uri is not None and library_version is not None
+            and (matched_track is not None or not comparison_helper.lookup_failed)):
+        database.insert_or_update_spotify_subsonic_match(
+            spotify_uri,
+            None if matched_track is None else matched_track["id"],
+            match_method,
+            library_version)
+
+    return matched_track
+
+
+def match_with_subsonic_track(
+        comparison_helper: ComparisonHelper, playlist_info, old_song_ids, cache: SubsonicCache) -> ComparisonHelper:
+    """compare spotify track to subsonic one"""
+    memo = match_memo
+    memo_key = None
+    if memo is not None and comparison_helper.track.get("uri") is not None:
+        # a newer library snapshot may match differently
+        memo_key = (comparison_helper.track["uri"],
+                    None if cache.index is None else cache.index.path)
+    found_in_memo, memo_match = False, None
+    if memo_key is not None:
+        found_in_memo, memo_match = memo.get(memo_key)
+    if found_in_memo:
+        (matched_track, comparison_helper.excluded,
+         comparison_helper.lookup_failed) = memo_match
+    else:
+        matched_track = find_subsonic_track(comparison_helper, cache)
+        if memo_key is not None:
+            memo.put(memo_key, (matched_track, comparison_helper.excluded,
+                                comparison_helper.lookup_failed))
 
     if matched_track is None:
         return comparison_helper
@@ -509,9 +1338,6 @@ def match_with_subsonic_track(
                 matched_track["title"],
                 matched_track["album"],
                 playlist_info["name"])
-            check_pysonic_connection().createPlaylist(
-                playlistId=playlist_info["subsonic_playlist_id"],
-                songIds=comparison_helper.song_ids)
 
     return comparison_helper
 
@@ -677,8 +1503,9 @@ def get_playlist_from_cache(key):
 
 
 def get_playlist_songs_ids_by_id(key):
-    """get playlist songs ids by id"""
+    """get playlist songs ids by id, along with every entry id in playlist order"""
     songs = []
+    entry_ids = []
     playlist_search = None
     try:
         playlist_search = check_pysonic_connection().getPlaylist(key)
@@ -699,8 +1526,8 @@ def get_playlist_songs_ids_by_id(key):
             and "playlist" in playlist_search
             and "entry" in playlist_search["playlist"]
             and len(playlist_search["playlist"]["entry"]) > 0):
-        songs = playlist_search["playlist"]["entry"]
         for entry in playlist_search["playlist"]["entry"]:
+            entry_ids.append(entry["id"] if "id" in entry else None)
             if "id" in entry and entry["id"] is not None and entry["id"].strip(
             ) != "":
                 if not is_ignored(
@@ -708,7 +1535,7 @@ def get_playlist_songs_ids_by_id(key):
                         playlist_search["playlist"]["name"]):
                     songs.append(entry["id"])
 
-    return songs
+    return songs, entry_ids
 
 
 def is_ignored(subsonic_song_id, playlist_name):
@@ -914,4 +1741,5 @@ def download_song(spotipy_helper, uri):
         return False
 
 
-spotify_cache = load_spotify_cache_from_file()
+cache_executor.submit(migrate_spotify_cache_file)
+cache_executor.submit(evict_spotify_cache)
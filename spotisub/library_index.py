@@ -0,0 +1,247 @@
+"""Spotisub subsonic library index"""
+import os
+import json
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import Table
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy import Text
+from sqlalchemy import Boolean
+from sqlalchemy import MetaData
+from sqlalchemy import desc
+from spotisub import constants
+from spotisub import utils
+from spotisub.classes import SubsonicSong
+
+LIBRARY_SONG = 'library_song'
+LIBRARY_ARTIST = 'library_artist'
+LIBRARY_ARTIST_TRIGRAM = 'library_artist_trigram'
+LIBRARY_INFO = 'library_info'
+
+CHUNK_SIZE = 500
+MMAP_SIZE = 268435456
+
+
+def set_read_pragmas(dbapi_connection, connection_record):
+    """map the index file in memory, shared with other processes via page cache"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA mmap_size=' + str(MMAP_SIZE))
+    cursor.execute('PRAGMA query_only=1')
+    cursor.close()
+
+
+class LibraryIndex:
+    """Read only subsonic library snapshot, one sqlite file each"""
+
+    metadata = MetaData()
+
+    library_song = Table(
+        LIBRARY_SONG, metadata, Column(
+            'position', Integer, primary_key=True), Column(
+            'id', String(36), unique=True, index=True, nullable=False), Column(
+                'title', Text, nullable=True), Column(
+                    'artist', Text, nullable=True, index=True), Column(
+                        'artistId', String(36), nullable=True), Column(
+                            'album', Text, nullable=True), Column(
+                                'albumId', String(36), nullable=True), Column(
+                                    'duration', Integer, nullable=True), Column(
+                                        'musicBrainzId', String(36), nullable=True, index=True), Column(
+                                            'match_key', Text, nullable=True, index=True), Column(
+                                                'title_variants', Text, nullable=True), Column(
+                                                    'artist_variants', Text, nullable=True))
+
+    library_artist = Table(
+        LIBRARY_ARTIST, metadata, Column(
+            'artist', Text, primary_key=True), Column(
+            'short', Boolean, nullable=False, index=True), Column(
+                'variants', Text, nullable=False))
+
+    library_artist_trigram = Table(
+        LIBRARY_ARTIST_TRIGRAM, metadata, Column(
+            'trigram', String(3), nullable=False, index=True), Column(
+            'artist', Text, nullable=False))
+
+    library_info = Table(
+        LIBRARY_INFO, metadata, Column(
+            'name', String(100), primary_key=True), Column(
+            'value', Text, nullable=True))
+
+    def __init__(self, path):
+        """open an index file written by write_library_index"""
+        self.path = path
+        # read only, a removed file can't be recreated empty
+        self.db_engine = create_engine(
+            'sqlite:///file:' + path + '?mode=ro&uri=true',
+            isolation_level=None)
+        event.listen(self.db_engine, 'connect', set_read_pragmas)
+
+    def song_columns(self):
+        """song record columns in SubsonicSong order, then variants and position"""
+        return [self.library_song.c[field] for field in constants.SUBSONIC_SONG_FIELDS] + [
+            self.library_song.c.title_variants,
+            self.library_song.c.artist_variants,
+            self.library_song.c.position]
+
+    def select_info(self):
+        """library metadata stored with the snapshot"""
+        with self.db_engine.connect() as conn:
+            records = conn.execute(select(self.library_info)).fetchall()
+        return {row.name: json.loads(row.value) for row in records}
+
+    def select_song_by_mbid(self, mbid):
+        """last library song tagged with mbid"""
+        with self.db_engine.connect() as conn:
+            row = conn.execute(
+                select(*self.song_columns()).where(
+                    self.library_song.c.musicBrainzId == mbid).order_by(
+                    desc(self.library_song.c.position)).limit(1)).first()
+        return None if row is None else row_to_song(row)
+
+    def select_song_by_id(self, song_id):
+        """library song with this subsonic id"""
+        with self.db_engine.connect() as conn:
+            row = conn.execute(
+                select(*self.song_columns()).where(
+                    self.library_song.c.id == song_id)).first()
+        return None if row is None else row_to_song(row)
+
+    def select_songs_by_match_key(self, match_key):
+        """library songs with this normalized title and artist"""
+        with self.db_engine.connect() as conn:
+            records = conn.execute(
+                select(*self.song_columns()).where(
+                    self.library_song.c.match_key == match_key).order_by(
+                    self.library_song.c.position)).fetchall()
+        return [row_to_song(row) for row in records]
+
+    def select_all_artists(self):
+        """every artist name of the library, with its compare variants"""
+        with self.db_engine.connect() as conn:
+            records = conn.execute(
+                select(self.library_artist.c.artist,
+                       self.library_artist.c.variants)).fetchall()
+        return {row.artist: utils.split_compare_array(row.variants)
+                for row in records}
+
+    def select_artists_by_trigrams(self, trigrams):
+        """artists sharing a trigram, plus those too short to have one,
+        with their compare variants"""
+        trigrams = list(trigrams)
+        artists = {}
+        with self.db_engine.connect() as conn:
+            records = conn.execute(
+                select(self.library_artist.c.artist,
+                       self.library_artist.c.variants).where(
+                    self.library_artist.c.short.is_(True))).fetchall()
+            for i in range(0, len(trigrams), CHUNK_SIZE):
+                records.extend(conn.execute(
+                    select(self.library_artist.c.artist,
+                           self.library_artist.c.variants).where(
+                        self.library_artist.c.artist.in_(
+                            select(self.library_artist_trigram.c.artist).where(
+                                self.library_artist_trigram.c.trigram.in_(
+                                    trigrams[i:i + CHUNK_SIZE]))))).fetchall())
+        for row in records:
+            artists[row.artist] = utils.split_compare_array(row.variants)
+        return artists
+
+    def select_songs_by_artists(self, artists):
+        """library songs of these artists, in library order"""
+        artists = list(artists)
+        records = []
+        with self.db_engine.connect() as conn:
+            for i in range(0, len(artists), CHUNK_SIZE):
+                records.extend(conn.execute(
+                    select(*self.song_columns()).where(
+                        self.library_song.c.artist.in_(
+                            artists[i:i + CHUNK_SIZE]))).fetchall())
+        records.sort(key=lambda row: row.position)
+        return [row_to_song(row) for row in records]
+
+    def select_all_songs(self):
+        """every library song, in library order"""
+        with self.db_engine.connect() as conn:
+            records = conn.execute(
+                select(*self.song_columns()).order_by(
+                    self.library_song.c.position)).fetchall()
+        return [row_to_song(row) for row in records]
+
+    def dispose(self):
+        """close pooled connections to the index file"""
+        self.db_engine.dispose()
+
+
+def row_to_song(row) -> SubsonicSong:
+    """library song record from a row selected with LibraryIndex.song_columns"""
+    return SubsonicSong(
+        *row[:len(constants.SUBSONIC_SONG_FIELDS)],
+        title_variants=utils.split_compare_array(row.title_variants),
+        artist_variants=utils.split_compare_array(row.artist_variants))
+
+
+def write_library_index(path, songs, info):
+    """write songs and their lookup tables to a new index file at path"""
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db_engine = create_engine('sqlite:///' + tmp_path, isolation_level=None)
+    try:
+        LibraryIndex.metadata.create_all(db_engine)
+        artists = {}
+        with db_engine.connect() as conn:
+            # the file is only renamed into place once complete
+            conn.exec_driver_sql('PRAGMA journal_mode=OFF')
+            conn.exec_driver_sql('PRAGMA synchronous=OFF')
+            conn.exec_driver_sql('BEGIN')
+            for i in range(0, len(songs), CHUNK_SIZE):
+                values = []
+                for position, song in enumerate(songs[i:i + CHUNK_SIZE], i):
+                    value = {field: getattr(song, field)
+                             for field in constants.SUBSONIC_SONG_FIELDS}
+                    value["position"] = position
+                    value["match_key"] = None
+                    if "title" in song and "artist" in song:
+                        value["match_key"] = utils.generate_match_key(
+                            song["title"], song["artist"])
+                    value["title_variants"] = None
+                    if "title" in song:
+                        value["title_variants"] = utils.join_compare_array(
+                            utils.generate_compare_array(song["title"]))
+                    value["artist_variants"] = None
+                    if "artist" in song:
+                        if song["artist"] not in artists:
+                            artists[song["artist"]] = utils.generate_compare_array(
+                                song["artist"])
+                        value["artist_variants"] = utils.join_compare_array(
+                            artists[song["artist"]])
+                    values.append(value)
+                conn.execute(insert(LibraryIndex.library_song), values)
+
+            artist_values = []
+            trigram_values = []
+            for artist, variants in artists.items():
+                # a variant shorter than a trigram can't be found by trigram lookup
+                artist_values.append({
+                    "artist": artist,
+                    "short": any(len(variant) < 3 for variant in variants),
+                    "variants": utils.join_compare_array(variants)})
+                for trigram in utils.generate_trigrams(variants):
+                    trigram_values.append({"trigram": trigram, "artist": artist})
+            for i in range(0, len(artist_values), CHUNK_SIZE):
+                conn.execute(insert(LibraryIndex.library_artist),
+                             artist_values[i:i + CHUNK_SIZE])
+            for i in range(0, len(trigram_values), CHUNK_SIZE):
+                conn.execute(insert(LibraryIndex.library_artist_trigram),
+                             trigram_values[i:i + CHUNK_SIZE])
+
+            conn.execute(insert(LibraryIndex.library_info), [
+                {"name": name, "value": json.dumps(value)}
+                for name, value in info.items()])
+            conn.exec_driver_sql('COMMIT')
+    finally:
+        db_engine.dispose()
+    os.replace(tmp_path, path)
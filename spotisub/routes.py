@@ -699,6 +699,18 @@ class SavedTracksClass(Resource):
 nsutils = api.namespace('utils', 'Utils APIs')
 
 
+@nsutils.route('/rebuild_library_cache')
+class RebuildLibraryCacheClass(Resource):
+    """Rebuild library cache class"""
+
+    def get(self):
+        """Rebuild library cache endpoint"""
+        subsonic_helper.check_pysonic_connection()
+        subsonic_helper.rebuild_subsonic_cache()
+        return get_response_json(get_json_message(
+            "Rebuilding the Subsonic library cache", True), 200)
+
+
 @nsutils.route('/healthcheck')
 class Healthcheck(Resource):
     """Healthcheck class"""
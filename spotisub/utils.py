@@ -2,6 +2,7 @@
 import os
 import re
 import sys
+import queue
 import logging
 import threading
 from spotisub import constants
@@ -58,17 +59,58 @@ def generate_compare_array(strings):
     return list(set(compare_array_values))
 
 
+def generate_match_key(title, artist):
+    """lowercase title and artist without punctuation, joined as a lookup key"""
+    return (re.sub(r'[^\w\s]', '', title.strip().lower()).strip() + "\x1f" +
+            re.sub(r'[^\w\s]', '', artist.strip().lower()).strip())
+
+
+def join_compare_array(strings):
+    """store a compare array as a single string"""
+    return None if strings is None else "\x1f".join(strings)
+
+
+def split_compare_array(value):
+    """compare array stored with join_compare_array"""
+    return () if value is None else tuple(value.split("\x1f"))
+
+
+def generate_trigrams(strings):
+    """generate trigrams of every string in the array"""
+    trigrams = set()
+    for value in strings:
+        for i in range(len(value) - 2):
+            trigrams.add(value[i:i + 3])
+    return trigrams
+
+
 def compare_strings(a, b):
     """compare strings"""
     return compare(generate_compare_array(a), generate_compare_array(b))
 
 
 def compare_track_metadata(comparison_helper, subsonic_track):
-    is_title_match = compare_strings(comparison_helper.track['name'], subsonic_track["title"])
-    is_artist_match = compare_strings(comparison_helper.artist_spotify["name"], subsonic_track["artist"])
+    """compare spotify track and library song title and artist variants"""
+    is_title_match = compare(comparison_helper.title_variants, subsonic_track.title_variants)
+    is_artist_match = compare(comparison_helper.artist_variants, subsonic_track.artist_variants)
     return is_title_match and is_artist_match
 
 
+def generate_spotify_fields(paths):
+    """spotify web api fields filter selecting the dotted paths"""
+    tree = {}
+    for path in paths:
+        node = tree
+        for name in path.split("."):
+            node = node.setdefault(name, {})
+
+    def render(node):
+        return ",".join(name + ("(" + render(child) + ")" if len(child) > 0 else "")
+                        for name, child in node.items())
+
+    return render(tree)
+
+
 def compare_string_to_exclusion(a, stringb):
     """compare string to exclusion"""
     if a is not None and a.strip() != '':
@@ -167,6 +209,45 @@ def get_sorting_dic(element):
         print()
 
 
+def iterate_in_background(iterable, max_buffered):
+    """items of iterable produced by a background thread,
+    at most max_buffered of them waiting to be consumed"""
+    buffer = queue.Queue(maxsize=max_buffered)
+    stopped = threading.Event()
+    done = object()
+
+    def put(value):
+        while not stopped.is_set():
+            try:
+                buffer.put(value, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            put((done, ex))
+
+    threading.Thread(target=produce, name="import_pipeline", daemon=True).start()
+    try:
+        while True:
+            item, ex = buffer.get()
+            if item is done:
+                if ex is not None:
+                    raise ex
+                return
+            yield item
+    finally:
+        # a consumer leaving early releases the producer
+        stopped.set()
+
+
 def check_thread_running_by_name(name):
     for thread in threading.enumerate():
         if thread.name == name and thread.is_alive():